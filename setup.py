@@ -19,6 +19,6 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.5',
-    install_requires=['osmnx', 'pandas', 'seaborn', 'scikit-learn'],
+    install_requires=['numpy', 'scipy', 'osmnx', 'pandas', 'seaborn', 'scikit-learn'],
     include_package_data=True,
 )
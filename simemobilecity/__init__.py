@@ -3,14 +3,18 @@ from simemobilecity.user import User
 from simemobilecity.car import Car
 from simemobilecity.poi import Poi
 from simemobilecity.topology import Topology
+from simemobilecity.assignment import Assignment
+from simemobilecity.spacing import Spacing
+from simemobilecity.cache import Cache
 from simemobilecity.mc import MC
 from simemobilecity.optimize import Optimize
 
 import simemobilecity.utils as utils
+import simemobilecity.queueing as queueing
 
 __all__ = [
     "P", "T",
     "User", "Car", "Poi",
-    "Topology", "MC", "Optimize",
-    "utils"
+    "Topology", "Assignment", "Spacing", "MC", "Optimize", "Cache",
+    "utils", "queueing"
 ]
@@ -0,0 +1,334 @@
+################################################################################
+# Assignment Class                                                             #
+#                                                                              #
+"""Assignment of graph nodes to their nearest charging stations."""
+################################################################################
+
+
+import heapq
+
+import numpy as np
+
+
+class Assignment:
+    """This class assigns each node of the topology graph to its nearest
+    charging stations with respect to the walking distance on the graph. For
+    each node, the given number of nearest stations is stored in order of
+    distance. Stations can be inserted and removed incrementally. An insertion
+    runs a search from the new station that stops at nodes already having the
+    given number of closer stations, and a removal only repairs the nodes of
+    the removed station, so that updates cost time proportional to the changed
+    area.
+
+    Parameters
+    ----------
+    topo : Topology
+        Topology object
+    stations : list, optional
+        List of charging station nodes
+    max_dist : float, optional
+        Maximal walking distance in m to search for stations, nodes without a
+        station within this distance are not assigned, leave empty for no
+        limit
+    k : integer, optional
+        Number of nearest stations stored for each node
+
+    Examples
+    --------
+    Following example updates the assignment after an optimization
+
+    .. code-block:: python
+
+        import simemobilecity as sec
+
+        assign = sec.Assignment(topo, list(capacity.keys()))
+        capacity = opt.run("", traj)
+        assign.update(capacity)
+
+        mc.set_assignment(assign)
+        mc.run("output/traj.obj", weeks=4, weeks_equi=1, capacity=capacity)
+    """
+    def __init__(self, topo, stations=[], max_dist=None, k=1):
+        # Initialize
+        self._topo = topo
+        self._k = k
+        self._max_dist = max_dist if max_dist is not None else np.inf
+        self._node_list = topo.get_nodes()
+        self._node_keys = {node: i for i, node in enumerate(self._node_list)}
+        self._stations = set()
+
+        # Create adjacency lists with the shortest of parallel edges
+        succ = [{} for node in self._node_list]
+        for u, v, length in topo.get_G().edges(data="length", default=1):
+            u, v = self._node_keys[u], self._node_keys[v]
+            if v not in succ[u] or length < succ[u][v]:
+                succ[u][v] = length
+        self._succ = [list(adj.items()) for adj in succ]
+        self._pred = [[] for node in self._node_list]
+        for u, adj in enumerate(self._succ):
+            for v, length in adj:
+                self._pred[v].append((u, length))
+
+        # Create assignment table
+        self._station = np.full((len(self._node_list), k), -1, dtype=int)
+        self._dist = np.full((len(self._node_list), k), np.inf)
+
+        # Add stations
+        for station in stations:
+            self.add(station)
+
+
+    ###################
+    # Private Methods #
+    ###################
+    def _search(self, heap, region=None):
+        """Run a Dijkstra search towards the stations on the reversed graph for
+        repairing the nearest station. Heap entries contain the distance, node
+        index and station index. Nodes are only updated and expanded if the
+        distance is smaller than their current distance.
+
+        Parameters
+        ----------
+        heap : list
+            Initial heap entries
+        region : set, optional
+            Set of node indices the search is limited to, leave empty for no
+            limit
+        """
+        heapq.heapify(heap)
+        while heap:
+            dist, u, station = heapq.heappop(heap)
+            if dist >= self._dist[u, 0]:
+                continue
+            self._dist[u, 0] = dist
+            self._station[u, 0] = station
+            for v, length in self._pred[u]:
+                dist_v = dist+length
+                if dist_v < self._dist[v, 0] and dist_v <= self._max_dist and (region is None or v in region):
+                    heapq.heappush(heap, (dist_v, v, station))
+
+    def _insert(self, station):
+        """Run a Dijkstra search from a new station on the reversed graph and
+        insert it into the station lists of the reached nodes. Nodes already
+        having the given number of closer stations are not expanded, since
+        all nodes reached through them have closer stations as well.
+
+        Parameters
+        ----------
+        station : integer
+            Station node index
+        """
+        heap = [(0, station)]
+        visited = set()
+        while heap:
+            dist, u = heapq.heappop(heap)
+            if u in visited or dist >= self._dist[u, -1]:
+                continue
+            visited.add(u)
+
+            # Insert station in order of distance
+            pos = np.searchsorted(self._dist[u], dist, side="right")
+            self._dist[u, pos+1:] = self._dist[u, pos:-1]
+            self._station[u, pos+1:] = self._station[u, pos:-1]
+            self._dist[u, pos] = dist
+            self._station[u, pos] = station
+
+            # Expand
+            for v, length in self._pred[u]:
+                dist_v = dist+length
+                if v not in visited and dist_v < self._dist[v, -1] and dist_v <= self._max_dist:
+                    heapq.heappush(heap, (dist_v, v))
+
+    def _repair(self, heap, region):
+        """Run a Dijkstra search towards the stations on the reversed graph for
+        repairing the station lists of a region of nodes. Heap entries contain
+        the distance, node index and station index. Each node of the region
+        accepts the given number of distinct stations in order of distance,
+        and only nodes accepting a station are expanded. Since the stations of
+        a node are also among the stations of the next node on the shortest
+        route to them, seeding the search with the station lists of the
+        neighbouring nodes outside the region finds all stations.
+
+        Parameters
+        ----------
+        heap : list
+            Initial heap entries
+        region : set
+            Set of node indices the search is limited to
+        """
+        num = {u: 0 for u in region}
+        heapq.heapify(heap)
+        while heap:
+            dist, u, station = heapq.heappop(heap)
+            if num[u]==self._k or station in self._station[u, :num[u]]:
+                continue
+            self._dist[u, num[u]] = dist
+            self._station[u, num[u]] = station
+            num[u] += 1
+            for v, length in self._pred[u]:
+                dist_v = dist+length
+                if v in region and num[v] < self._k and dist_v <= self._max_dist:
+                    heapq.heappush(heap, (dist_v, v, station))
+
+
+    ##################
+    # Public Methods #
+    ##################
+    def add(self, station):
+        """Insert a charging station and update the nodes it reaches.
+
+        Parameters
+        ----------
+        station : integer
+            Charging station node
+        """
+        if station in self._stations:
+            return
+        self._stations.add(station)
+        self._insert(self._node_keys[station])
+
+    def remove(self, station):
+        """Remove a charging station and repair the nodes containing it. The
+        search is limited to the affected nodes and seeded from the stations
+        of the neighbouring nodes keeping their stations, see :func:`_repair`
+        for multiple stations per node.
+
+        Parameters
+        ----------
+        station : integer
+            Charging station node
+        """
+        if station not in self._stations:
+            return
+        self._stations.remove(station)
+
+        # Get affected nodes
+        affected = np.flatnonzero((self._station==self._node_keys[station]).any(axis=1))
+
+        # Reset nodes of removed station
+        self._station[affected] = -1
+        self._dist[affected] = np.inf
+        region = set(affected.tolist())
+
+        # Repair station lists seeded from all stations of unaffected neighbours
+        if self._k > 1:
+            stations = set(self._node_keys[node] for node in self._stations)
+            heap = [(0, u, u) for u in region if u in stations]
+            for u in region:
+                for v, length in self._succ[u]:
+                    if v not in region:
+                        for rank in np.flatnonzero(self._station[v] >= 0):
+                            if self._dist[v, rank]+length <= self._max_dist:
+                                heap.append((self._dist[v, rank]+length, u, self._station[v, rank]))
+            self._repair(heap, region)
+            return
+
+        # Seed search from unaffected neighbours
+        heap = []
+        for u in region:
+            for v, length in self._succ[u]:
+                if v not in region and self._station[v, 0] >= 0 and self._dist[v, 0]+length <= self._max_dist:
+                    heap.append((self._dist[v, 0]+length, u, self._station[v, 0]))
+        self._search(heap, region)
+
+    def update(self, capacity):
+        """Update stations to the nodes of a capacity dictionary by removing
+        missing and inserting new stations.
+
+        Parameters
+        ----------
+        capacity : dictionary, list
+            Dictionary containing charing station nodes and capacities, or list
+            of charging station nodes
+        """
+        for station in [station for station in self._stations if station not in capacity]:
+            self.remove(station)
+        for station in capacity:
+            self.add(station)
+
+
+    ##################
+    # Getter Methods #
+    ##################
+    def get_station(self, node, rank=0):
+        """Get nearest charging station of a node.
+
+        Parameters
+        ----------
+        node : integer
+            Node
+        rank : integer, optional
+            Rank of the station, zero for the nearest station
+
+        Returns
+        -------
+        station : integer
+            Charging station node, None if no station is within reach
+        """
+        index = self._station[self._node_keys[node], rank]
+        return self._node_list[index] if index >= 0 else None
+
+    def get_dist(self, node, rank=0):
+        """Get walking distance of a node to its nearest charging station.
+
+        Parameters
+        ----------
+        node : integer
+            Node
+        rank : integer, optional
+            Rank of the station, zero for the nearest station
+
+        Returns
+        -------
+        dist : float
+            Walking distance in m, infinite if no station is within reach
+        """
+        return self._dist[self._node_keys[node], rank]
+
+    def get_table(self, rank=0):
+        """Get assignment table in order of the topology nodes.
+
+        Parameters
+        ----------
+        rank : integer, optional
+            Rank of the stations, zero for the nearest station
+
+        Returns
+        -------
+        stations : list
+            List of charging station nodes, None for nodes without a station
+            within reach
+        dists : numpy.ndarray
+            Walking distances in m
+        """
+        return [self._node_list[index] if index >= 0 else None for index in self._station[:, rank]], self._dist[:, rank].copy()
+
+    def get_k(self):
+        """Get number of nearest stations stored for each node.
+
+        Returns
+        -------
+        k : integer
+            Number of stations
+        """
+        return self._k
+
+    def get_max_dist(self):
+        """Get maximal walking distance to search for stations.
+
+        Returns
+        -------
+        max_dist : float
+            Maximal walking distance in m, infinite for no limit
+        """
+        return self._max_dist
+
+    def get_stations(self):
+        """Get charging stations.
+
+        Returns
+        -------
+        stations : list
+            List of charging station nodes
+        """
+        return list(self._stations)
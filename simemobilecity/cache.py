@@ -0,0 +1,254 @@
+################################################################################
+# Cache Class                                                                  #
+#                                                                              #
+"""Content-addressed storage of simulation and optimization results."""
+################################################################################
+
+
+import os
+import pickle
+import hashlib
+
+import numpy as np
+
+from simemobilecity.poi import Poi
+from simemobilecity.partition import P, T
+from simemobilecity.topology import Topology
+
+
+class Cache:
+    """This class stores results in a local directory under a key, that is a
+    stable hash of all inputs, so that identical runs can be loaded instead
+    of being recomputed. Each entry contains a checksum of its content, and
+    corrupted entries are removed once detected. The directory size is
+    bounded by removing the least recently used entries, with the file
+    modification time updated on each access.
+
+    Parameters
+    ----------
+    link : string
+        Cache directory
+    max_bytes : integer, optional
+        Maximal total size of all entries in bytes, leave empty for no limit
+    max_entries : integer, optional
+        Maximal number of entries, leave empty for no limit
+
+    Examples
+    --------
+    Following example caches the results of the MC code
+
+    .. code-block:: python
+
+        import simemobilecity as sec
+
+        mc.set_cache(sec.Cache("output/cache", max_bytes=10*1024**3))
+        traj = mc.run("output/traj.obj", weeks=4, weeks_equi=1, seed=42)
+    """
+    def __init__(self, link, max_bytes=None, max_entries=None):
+        # Initialize
+        self._link = link
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+
+        # Create directory
+        if not os.path.exists(link):
+            os.makedirs(link)
+
+
+    ###################
+    # Private Methods #
+    ###################
+    def _update(self, sha, obj):
+        """Add object to hash. Containers are processed recursively, topologies
+        by their fingerprint, POIs by their probabilities, nodes and maximal
+        distance, other probability objects like users by their type and
+        probabilities, trajectories and arrays by their content. All other
+        objects are hashed in pickled form.
+
+        Parameters
+        ----------
+        sha : hashlib.sha256
+            Hash object
+        obj : object
+            Object to hash
+        """
+        if isinstance(obj, dict):
+            sha.update(b"dict%i" % len(obj))
+            for key, val in obj.items():
+                self._update(sha, key)
+                self._update(sha, val)
+        elif isinstance(obj, (list, tuple)):
+            sha.update(b"list%i" % len(obj))
+            for val in obj:
+                self._update(sha, val)
+        elif isinstance(obj, Topology):
+            sha.update(b"topo"+obj.get_fingerprint().encode())
+        elif isinstance(obj, Poi):
+            sha.update(b"poi")
+            self._update(sha, [obj.get_array(), obj.get_nodes(), obj.get_max_dist()])
+        elif isinstance(obj, P):
+            sha.update(b"p"+type(obj).__name__.encode())
+            self._update(sha, obj.get_array())
+        elif isinstance(obj, T):
+            sha.update(b"traj")
+            self._update(sha, [obj.get_array(), obj.get_failures(), obj.get_node_keys()])
+        elif isinstance(obj, np.ndarray):
+            sha.update(b"array"+str(obj.dtype).encode()+str(obj.shape).encode())
+            sha.update(np.ascontiguousarray(obj).tobytes())
+        else:
+            sha.update(pickle.dumps(obj, protocol=4))
+
+    def _file(self, key):
+        """Get file link of an entry.
+
+        Parameters
+        ----------
+        key : string
+            Entry key
+
+        Returns
+        -------
+        link : string
+            File link
+        """
+        return os.path.join(self._link, key+".obj")
+
+    def _evict(self):
+        """Remove least recently used entries until the size and number of
+        entries are within the limits."""
+        # Get entries sorted by last access
+        entries = []
+        with os.scandir(self._link) as files:
+            for entry in files:
+                if entry.name.endswith(".obj"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        # Remove oldest entries, which may already be removed by another process
+        size = sum(entry[1] for entry in entries)
+        num = len(entries)
+        for mtime, file_size, link in entries:
+            if (self._max_bytes is None or size <= self._max_bytes) and (self._max_entries is None or num <= self._max_entries):
+                break
+            if os.path.exists(link):
+                os.remove(link)
+            size -= file_size
+            num -= 1
+
+
+    ##################
+    # Public Methods #
+    ##################
+    def key(self, *args):
+        """Create entry key from inputs.
+
+        Parameters
+        ----------
+        args : list
+            Inputs
+
+        Returns
+        -------
+        key : string
+            Hexadecimal sha256 hash of the inputs
+        """
+        sha = hashlib.sha256()
+        self._update(sha, list(args))
+        return sha.hexdigest()
+
+    def load(self, key):
+        """Load entry. Entries not matching their checksum are removed.
+
+        Parameters
+        ----------
+        key : string
+            Entry key
+
+        Returns
+        -------
+        obj : object
+            Stored object, None if the entry does not exist or is corrupted
+        """
+        # Read entry
+        link = self._file(key)
+        try:
+            with open(link, "rb") as file_in:
+                checksum = file_in.readline().strip().decode()
+                data = file_in.read()
+        except OSError:
+            self._misses += 1
+            return
+
+        # Check content
+        if hashlib.sha256(data).hexdigest()!=checksum:
+            print("Cache.load: Corrupted entry removed...")
+            os.remove(link)
+            self._misses += 1
+            return
+
+        # Mark as recently used
+        os.utime(link)
+        self._hits += 1
+
+        return pickle.loads(data)
+
+    def save(self, key, obj):
+        """Save entry and remove least recently used entries exceeding the
+        limits. The entry is written to a temporary file first, so that
+        interrupted writes and parallel processes do not leave incomplete
+        entries.
+
+        Parameters
+        ----------
+        key : string
+            Entry key
+        obj : object
+            Object to store
+        """
+        # Write entry
+        data = pickle.dumps(obj, protocol=4)
+        link = self._file(key)
+        link_tmp = link+"."+str(os.getpid())+".tmp"
+        with open(link_tmp, "wb") as file_out:
+            file_out.write(hashlib.sha256(data).hexdigest().encode()+b"\n")
+            file_out.write(data)
+        os.replace(link_tmp, link)
+
+        # Evict entries
+        self._evict()
+
+    def clear(self):
+        """Remove all entries."""
+        for file_name in os.listdir(self._link):
+            if file_name.endswith(".obj"):
+                os.remove(os.path.join(self._link, file_name))
+
+
+    ##################
+    # Getter Methods #
+    ##################
+    def get_link(self):
+        """Get cache directory.
+
+        Returns
+        -------
+        link : string
+            Cache directory
+        """
+        return self._link
+
+    def get_stats(self):
+        """Get number of cache hits and misses.
+
+        Returns
+        -------
+        stats : dictionary
+            Dictionary containing the number of **hits** and **misses**
+        """
+        return {"hits": self._hits, "misses": self._misses}
@@ -0,0 +1,129 @@
+################################################################################
+# Kernel                                                                       #
+#                                                                              #
+"""Compiled kernels for the Monte Carlo hour step."""
+################################################################################
+
+
+import numpy as np
+
+try:
+    import numba
+    IS_NUMBA = True
+except ImportError:
+    IS_NUMBA = False
+
+
+def jit(func):
+    """Compile a function with Numba in nopython mode if available, otherwise
+    return the function unchanged.
+
+    Parameters
+    ----------
+    func : function
+        Function to compile
+
+    Returns
+    -------
+    func : function
+        Compiled or original function
+    """
+    return numba.njit(cache=True)(func) if IS_NUMBA else func
+
+
+@jit
+def seed(value):
+    """Set random seed of the kernels. Compiled kernels use a random state
+    separate from numpy.
+
+    Parameters
+    ----------
+    value : integer
+        Random seed
+    """
+    np.random.seed(value)
+
+
+@jit
+def fill_hour(drivers, users, users_p, nodes_p, nodes_draw, assign, assign_dist, nodes_dist, station_max, station_tot, station_cap, val_nodes, val_cs, val_dist, is_equi):
+    """Run filling step of all drivers of an hour on the array form of the MC
+    state. Drivers are processed sequentially, so that each driver sees the
+    station occupancy left by the previous drivers. Sessions, occupancy and
+    distance failures are counted in value arrays in the layout of the
+    trajectory hour, see :func:`simemobilecity.partition.T.add_hour`, with
+    the success at index zero, occupancy failures at index one and distance
+    failures at index two.
+
+    Parameters
+    ----------
+    drivers : integer
+        Number of drivers
+    users : numpy.ndarray
+        User id list according to the user percentages
+    users_p : numpy.ndarray
+        Driving probability of each user for the hour
+    nodes_p : numpy.ndarray
+        Probability of each node for the hour
+    nodes_draw : numpy.ndarray
+        Node index of each original node, destinations are drawn uniformly
+        from the original nodes
+    assign : numpy.ndarray
+        Charging station indices of each node in order of distance, negative
+        if no station is within reach
+    assign_dist : numpy.ndarray
+        Walking distances of each node to the assigned stations
+    nodes_dist : numpy.ndarray
+        Maximal walking distance of each node
+    station_max : numpy.ndarray
+        Capacity of each station
+    station_tot : numpy.ndarray
+        Total occupancy of each station, updated in place
+    station_cap : numpy.ndarray
+        Occupancy of each station for each user, updated in place
+    val_nodes : numpy.ndarray
+        Node values, updated in place
+    val_cs : numpy.ndarray
+        Charging station values, updated in place
+    val_dist : numpy.ndarray
+        Walking distance values, updated in place
+    is_equi : bool
+        True for equilibration run to not count values
+    """
+    for driver in range(drivers):
+        # Choose random user
+        user_id = users[np.random.randint(0, users.size)]
+        if np.random.random() > users_p[user_id]:
+            continue
+
+        # Choose random node
+        node_id = nodes_draw[np.random.randint(0, nodes_draw.size)]
+        if np.random.random() > nodes_p[node_id]:
+            continue
+
+        # Choose charging station
+        station_id, dist, fail = -1, 0.0, 2
+        for rank in range(assign.shape[1]):
+            if assign[node_id, rank] < 0:
+                break
+            station_id, dist = assign[node_id, rank], assign_dist[node_id, rank]
+            if dist > nodes_dist[node_id]:
+                fail = 2
+                break
+            if station_tot[station_id]==station_max[station_id]:
+                fail = 1
+                continue
+            fail = 0
+            break
+
+        # Count values
+        if not is_equi:
+            val_nodes[node_id, fail, user_id] += 1
+            if station_id >= 0:
+                val_cs[station_id, fail, user_id] += 1
+                if fail!=1:
+                    val_dist[station_id, fail//2, user_id] += dist
+
+        # Add session
+        if fail==0:
+            station_cap[station_id, user_id] += 1
+            station_tot[station_id] += 1
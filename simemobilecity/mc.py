@@ -5,12 +5,19 @@
 ################################################################################
 
 
+import os
 import sys
+import copy
+import heapq
 import random
 
+import numpy as np
+
 import simemobilecity.utils as utils
+import simemobilecity.kernel as kernel
 
-from simemobilecity.partition import P, T
+from simemobilecity.partition import P, T, stack, normalize
+from simemobilecity.queueing import erlang_b
 
 
 class MC:
@@ -59,6 +66,12 @@ class MC:
         self._users = {}
         self._pois = []
         self._drivers = {}
+        self._nodes_key = None
+        self._station_list = None
+        self._assignment = None
+        self._cache = None
+        self._occupancy = None
+        self._driver_counts = None
 
     def add_user(self, user, percentage):
         """Add User to simulation system.
@@ -90,6 +103,8 @@ class MC:
             POI object
         """
         self._pois.append(poi)
+        self._nodes_key = None
+        self._station_list = None
 
     def set_drivers(self, drivers):
         """Add number of drivers.
@@ -118,86 +133,357 @@ class MC:
 
         self._drivers = drivers
 
-    def _prepare(self, node_p, p_norm, max_dist):
-        """This helper function processes user and poi inputs into node list.
-        User ids are added to a user list for the nodes, to count the number
-        of successful and unsuccessfull attempts to reach destination.
-        POI probabilities are added to the nodes to set the probability for
-        choosing certain nodes as a destination.
+    def set_assignment(self, assign):
+        """Set station assignment object for determining the nearest charging
+        station of the nodes with respect to the walking distance. The
+        assignment is updated incrementally to the charging stations of each
+        run. By default, the nearest charging station of all nodes is
+        determined with a single search each time the stations change.
 
-        Nodes have a dictionary contatining a probability object, while charging
-        stations are a dictionary used for simulation to fill in the capacity
-        and compare to the maximum capacity.
+        If the assignment stores multiple stations for each node, drivers
+        finding an occupied station try the next station in order of distance,
+        until a station is free or the maximal walking distance is exceeded.
 
         Parameters
         ----------
-        node_p : dictionary, float
-            Probability of all nodes not covered by pois each hour each weekday,
-            either a float for the same probability each hour, dictionary of hours
-            for same hour distribution for all days, a dictionary of days for the
-            same hour probability for different days, or a dictionary of days each
-            with a dictionary of hours
+        assign : Assignment
+            Station assignment object, None to use the default
+        """
+        self._assignment = assign
+        self._station_list = None
+
+    def set_cache(self, cache):
+        """Set result cache. Runs with identical inputs, including the
+        topology, users, POIs, drivers, capacities, run parameters and random
+        seed, are loaded from the cache instead of being simulated. Runs
+        without a seed are identified by the state of the random number
+        generators, which is set to the state after the run when loading from
+        the cache, so that consecutive runs still differ. POIs are identified
+        by the same content used for reusing the node arrays, see
+        :func:`_node_inputs`, so that changed POIs are simulated again. Runs
+        with memory-mapped trajectories and unseeded runs of the compiled
+        kernel, whose random state is not accessible, are not cached.
+
+        Parameters
+        ----------
+        cache : Cache
+            Cache object, None to disable caching
+        """
+        self._cache = cache
+
+    def _node_inputs(self, node_p, p_norm, max_dist):
+        """Return all inputs of the node arrays, see :func:`_prepare_nodes`,
+        containing the probabilities, nodes and maximal distances of the POIs,
+        so that changes of registered POIs are detected.
+
+        Parameters
+        ----------
+        node_p : P
+            Probability of all nodes not covered by pois each hour each weekday
+        p_norm: string
+            Normalization type of POI probabilities
+        max_dist : float
+            Maximal allowed walking distance for nodes not covered by POIs
+
+        Returns
+        -------
+        inputs : tuple
+            Node array inputs
+        """
+        pois = tuple((poi.get_array().tobytes(), tuple(poi.get_nodes()), poi.get_max_dist()) for poi in self._pois)
+        return (node_p.get_array().tobytes(), p_norm, max_dist, pois)
+
+    def _prepare_nodes(self, node_p, p_norm, max_dist):
+        """This helper function processes the poi inputs into node arrays. POI
+        probabilities are summed up for each node to set the probability for
+        choosing certain nodes as a destination, and the maximal allowed
+        walking distances are averaged. Nodes not covered by POIs are assigned
+        the given probability and distance.
+
+        For a coarse topology, see
+        :func:`simemobilecity.topology.Topology.coarsen`, the probabilities
+        are determined and normalized for the original nodes and averaged over
+        the nodes of each cell, as are the distances. Destinations are drawn
+        from the original nodes and mapped to their cells, so that each cell is
+        chosen with the share of original nodes it contains and the expected
+        number of drivers heading to each cell is kept.
+
+        The result is an array of nodes, days and hours containing the
+        probabilities, an array with the walking distance for each node, the
+        number of original nodes of each node and an array mapping drawn
+        original nodes to nodes. It is reused for subsequent runs with the same
+        inputs, including the content of the POIs, see :func:`_node_inputs`.
+
+        Parameters
+        ----------
+        node_p : P
+            Probability of all nodes not covered by pois each hour each weekday
         p_norm: string
-            Normalize POI dicts with maximum value from all nodes based on given
-            type :math:`\\rightarrow` largest value is equal to one
+            Normalize POI probabilities with maximum value from all nodes based
+            on given type :math:`\\rightarrow` largest value is equal to one
         max_dist : float
             Maximal allowed walking distance from charging station to node in m, for
             nodes not covered by given POI objects
         """
+        # Check if inputs changed
+        key = self._node_inputs(node_p, p_norm, max_dist)
+        if self._nodes_key==key:
+            return
+
         # Initialize
-        self._nodes = {}
-        self._nodes_dist = {}
-
-        # Process poi
-        max_p = {day: {hour: 0 for hour in range(24)} for day in range(7)}
-        for poi in self._pois:
-            for node in poi.get_nodes():
-                if node not in self._nodes.keys():
-                    self._nodes[node] = P(p=poi.get_p())
-                    self._nodes_dist[node] = [poi.get_max_dist(), 1]
-                else:
-                    # Sum up probabilitty
-                    temp_p = {}
-                    for day in range(7):
-                        temp_p[day] = {}
-                        for hour in range(24):
-                            temp_p[day][hour] = self._nodes[node].get_p_hour(day, hour)+poi.get_p_hour(day, hour)
-                            max_p[day][hour] = temp_p[day][hour] if temp_p[day][hour]>max_p[day][hour] else max_p[day][hour]
-                    self._nodes[node] = P(p=temp_p)
-                    # Sum up distance
-                    self._nodes_dist[node][0] += poi.get_max_dist()
-                    self._nodes_dist[node][1] += 1
-
-        # Fill empty nodes
-        for node in self._topo.get_nodes():
-            if node not in self._nodes.keys():
-                self._nodes[node] = node_p
-                self._nodes_dist[node] = [max_dist, 1]
-
-        # Normalize probability matrix
+        self._node_list = self._topo.get_nodes()
+        self._node_keys = {node: i for i, node in enumerate(self._node_list)}
+
+        # Get cells of original nodes
+        cells = self._topo.get_cells()
+        orig_list = list(cells.keys()) if cells is not None else self._node_list
+        orig_keys = {node: i for i, node in enumerate(orig_list)} if cells is not None else self._node_keys
+        self._nodes_draw = np.array([self._node_keys[cells[node]] for node in orig_list], dtype=int) if cells is not None else np.arange(len(self._node_list))
+        self._nodes_w = np.bincount(self._nodes_draw, minlength=len(self._node_list))
+
+        # Process poi for covered original nodes
+        index = [np.array([orig_keys[node] for node in poi.get_nodes()], dtype=int) for poi in self._pois]
+        covered = np.unique(np.concatenate(index)) if index else np.zeros(0, dtype=int)
+        rows = np.full(len(orig_list), -1, dtype=int)
+        rows[covered] = np.arange(covered.size)
+        nodes_p = np.zeros((covered.size+1, 7, 24))
+        nodes_dist = np.zeros(len(orig_list))
+        num_pois = np.zeros(len(orig_list))
+        for poi, poi_index in zip(self._pois, index):
+            np.add.at(nodes_p, rows[poi_index], poi.get_array())
+            np.add.at(nodes_dist, poi_index, poi.get_max_dist())
+            np.add.at(num_pois, poi_index, 1)
+
+        # Fill empty nodes, represented by the last row
+        is_empty = num_pois==0
+        if is_empty.any():
+            nodes_p[-1] = node_p.get_array()
+        nodes_dist[is_empty] = max_dist
+        num_pois[is_empty] = 1
+
+        # Normalize probability and distance
         if p_norm:
-            max_p_week = max([max(max_p[day].values()) for day in range(7)])
-            max_p_day = {day: max(max_p[day].values()) for day in range(7)}
-            for node, p in self._nodes.items():
-                if p_norm=="week":
-                    p.set_p({day: {hour: p.get_p_hour(day, hour)/max_p_week if p.get_p_hour(day, hour) and max_p_week else 0 for hour in range(24)} for day in range(7)})
-                elif p_norm=="day":
-                    p.set_p({day: {hour: p.get_p_hour(day, hour)/max_p_day[day] if p.get_p_hour(day, hour) and max_p_day[day] else 0 for hour in range(24)} for day in range(7)})
-                elif p_norm=="hour":
-                    p.set_p({day: {hour: p.get_p_hour(day, hour)/max_p[day][hour] if p.get_p_hour(day, hour) and max_p[day][hour] else 0 for hour in range(24)} for day in range(7)})
-
-        # Normalize distance matrix
-        self._nodes_dist = {node: dist[0]/dist[1] for node, dist in self._nodes_dist.items()}
+            nodes_p = normalize(nodes_p, p_norm)
+        nodes_dist /= num_pois
+
+        # Average over cells
+        self._nodes_p = np.zeros((len(self._node_list), 7, 24))
+        np.add.at(self._nodes_p, self._nodes_draw[covered], nodes_p[:-1])
+        self._nodes_p += np.bincount(self._nodes_draw[is_empty], minlength=len(self._node_list))[:, np.newaxis, np.newaxis]*nodes_p[-1]
+        self._nodes_p /= self._nodes_w[:, np.newaxis, np.newaxis]
+        self._nodes_dist = np.bincount(self._nodes_draw, weights=nodes_dist, minlength=len(self._node_list))/self._nodes_w
+
+        self._nodes_key = key
+
+    def _prepare(self, node_p, p_norm, max_dist, dtype=int):
+        """This helper function processes user and poi inputs into node arrays,
+        see :func:`_prepare_nodes`, and creates the charging station dictionary
+        and the trajectories. User ids are added to a user list for the nodes,
+        to count the number of successful and unsuccessfull attempts to reach
+        destination.
+
+        Charging stations are a dictionary used for simulation to fill in the
+        capacity and compare to the maximum capacity.
+
+        Parameters
+        ----------
+        node_p : P
+            Probability of all nodes not covered by pois each hour each weekday
+        p_norm: string
+            Normalize POI probabilities with maximum value from all nodes based
+            on given type :math:`\\rightarrow` largest value is equal to one
+        max_dist : float
+            Maximal allowed walking distance from charging station to node in m, for
+            nodes not covered by given POI objects
+        dtype : type, optional
+            Data type of the node and station trajectories, float for expected
+            values
+        """
+        # Process nodes
+        self._prepare_nodes(node_p, p_norm, max_dist)
 
         # Process stations
-        self._stations = {station: {"max": capacity, "cap": [0 for user_id in range(len(self._users.keys()))]} for station, capacity in self._capacity.items()}
+        self._prepare_stations()
 
         # Create trajectory
-        self._traj["nodes"] = T(len(self._nodes.keys()), len(self._users.keys()), node_keys={node: i for i, node in enumerate(list(self._nodes.keys()))})
-        self._traj["cs"] = T(len(self._stations.keys()), len(self._users.keys()), node_keys={cs: i for i, cs in enumerate(list(self._stations.keys()))})
-        self._traj["dist"] = T(len(self._stations.keys()), len(self._users.keys()), node_keys={cs: i for i, cs in enumerate(list(self._stations.keys()))}, failures=["dist"])
+        links = {name: os.path.join(self._mmap, name+".npy") if self._mmap else "" for name in ["nodes", "cs", "dist"]}
+        self._traj["nodes"] = T(len(self._node_list), len(self._users.keys()), node_keys=self._node_keys, link=links["nodes"], dtype=dtype)
+        self._traj["cs"] = T(len(self._station_list), len(self._users.keys()), node_keys=self._station_keys, link=links["cs"], dtype=dtype)
+        self._traj["dist"] = T(len(self._station_list), len(self._users.keys()), node_keys=self._station_keys, failures=["dist"], link=links["dist"])
+
+    def _prepare_stations(self):
+        """This helper function creates the charging station state. Stations
+        are indexed in order of the capacity dictionary. The occupancy is an
+        array of stations and user types, with the total occupancy of each
+        station kept in a separate array, which is updated with each session,
+        and the capacities in a parallel array.
+
+        The station assignment table contains the index of the nearest
+        charging station and the walking distance for each node. It is filled
+        for all nodes at once with a single search from all stations, see
+        :func:`simemobilecity.topology.Topology.nearest`, and is reused for
+        subsequent runs with the same stations. If an assignment
+        object is set, it is updated to the current stations and the table is
+        taken from it, see :class:`simemobilecity.assignment.Assignment`.
+        """
+        # Process stations
+        station_list = list(self._capacity.keys())
+        self._station_keys = {station: i for i, station in enumerate(station_list)}
+        self._station_max = np.array([self._capacity[station] for station in station_list], dtype=int)
+        self._station_cap = np.zeros((len(station_list), len(self._users.keys())), dtype=int)
+        self._station_tot = np.zeros(len(station_list), dtype=int)
+        self._occupancy = None
+
+        # Process station assignment
+        if self._assignment is not None:
+            self._assignment.update(self._capacity)
+            k = self._assignment.get_k()
+            self._assign = np.full((len(self._node_list), k), -2, dtype=int)
+            self._assign_dist = np.zeros((len(self._node_list), k))
+            for rank in range(k):
+                stations, self._assign_dist[:, rank] = self._assignment.get_table(rank)
+                self._assign[:, rank] = [self._station_keys[station] if station is not None else -2 for station in stations]
+        elif self._station_list!=station_list:
+            stations, dists = self._topo.nearest(self._node_list, station_list)
+            self._assign = np.array([[self._station_keys[station] if station is not None else -2] for station in stations], dtype=int).reshape(-1, 1)
+            self._assign_dist = np.where(np.isfinite(dists), dists, 0).reshape(-1, 1)
+        self._station_list = station_list
+
+    def _assign_node(self, node_id):
+        """Return nearest charging stations and walking distances of a node
+        from the station assignment table.
+
+        Parameters
+        ----------
+        node_id : integer
+            Node index
+
+        Returns
+        -------
+        station_ids : numpy.ndarray
+            Charging station indices in order of distance, negative if no
+            station is within reach
+        dists : numpy.ndarray
+            Walking distances from node to charging stations
+        """
+        return self._assign[node_id], self._assign_dist[node_id]
+
+    def _choose_station(self, node_id):
+        """Choose charging station for a driver heading to a node. The stations
+        of the assignment table are tried in order of distance, until a station
+        is free or the maximal walking distance of the node is exceeded, which
+        fails the attempt due to distance at the first station out of reach,
+        regardless of its occupancy. By default, the table only contains the
+        nearest station.
+
+        Parameters
+        ----------
+        node_id : integer
+            Node index
+
+        Returns
+        -------
+        station_id : integer
+            Index of chosen or last tried station, negative if no station is
+            within reach
+        dist : float
+            Walking distance from node to charging station
+        fail : string
+            Failure reason, empty for success
+        """
+        # Initialize
+        station_ids, dists = self._assign_node(node_id)
+        station_id, dist, fail = -1, 0, "dist"
+
+        # Run through stations
+        for rank in range(station_ids.size):
+            if station_ids[rank] < 0:
+                break
+            station_id, dist = station_ids[rank], dists[rank]
+            ## Check distance, further stations are even more distant
+            if dist > self._nodes_dist[node_id]:
+                fail = "dist"
+                break
+            ## Check occupancy and try next station
+            if self._station_tot[station_id]==self._station_max[station_id]:
+                fail = "occ"
+                continue
+            return station_id, dist, ""
+
+        return station_id, dist, fail
+
+    def _set_occupancy(self, occupancy):
+        """Set initial charging station occupancy. Stations not contained in
+        the current capacities are ignored, and occupancies exceeding the
+        capacity of a station are reduced starting with the last user.
+
+        Parameters
+        ----------
+        occupancy : dictionary
+            Dictionary of charging station nodes with a list of the number of
+            parked cars for each user type
+        """
+        for station, occ in occupancy.items():
+            if station in self._station_keys:
+                station_id = self._station_keys[station]
+                occ = np.array(occ, dtype=int)
+                for user_id in reversed(range(occ.size)):
+                    occ[user_id] -= min(occ[user_id], max(occ.sum()-self._station_max[station_id], 0))
+                self._station_cap[station_id] = occ
+                self._station_tot[station_id] = occ.sum()
+
+    def _set_capacity(self, capacity):
+        """Set charging station capacities and graph, load charging stations
+        from OSM if no capacities are given. For a coarse topology, capacities
+        of the original nodes are combined for each cell.
+
+        Parameters
+        ----------
+        capacity : dictionary
+            Dictionary containing charing station nodes and capacities
+        """
+        if capacity:
+            capacity = self._topo.aggregate(capacity)
+            self._charge_G = self._topo.get_G().subgraph(capacity.keys())
+            self._capacity = capacity
+        else:
+            self._charge_G, self._capacity = self._topo.charging_station()
+
+    def _check_inputs(self, p_norm):
+        """Check simulation inputs and create the user list, containing the
+        user ids according to their percentage, and the user probability
+        array.
+
+        Parameters
+        ----------
+        p_norm: string
+            Normalization type of POI probabilities
+
+        Returns
+        -------
+        users : list
+            User id list, None if inputs are invalid
+        """
+        # Process users
+        if sum([x["percent"] for x in self._users.values()]) < 100:
+            print("MC.run: ERROR - User percentages do not add up to 100...")
+            return
+        users = sum([[user_id for x in range(user["percent"])] for user_id, user in self._users.items()], [])
+        self._users_p = stack([user["user"] for user in self._users.values()])
 
-    def run(self, file_out, weeks, weeks_equi, capacity={}, trials=100, node_p=0.1, p_norm="", max_dist=500):
+        # Process normalization
+        if p_norm not in ["", "week", "day", "hour"]:
+            print("MC.run: ERROR - Wrong p_norm value - choose from \"\", \"week\", \"day\", \"hour\"...")
+            return
+
+        # Process drivers
+        if not self._drivers:
+            print("MC.run: ERROR - No drivers set...")
+            return
+
+        return users
+
+    def run(self, file_out, weeks, weeks_equi, capacity={}, trials=100, node_p=0.1, p_norm="", max_dist=500, mmap="", is_stats=False, bins=[], seed=None, engine="hour", slots=1, is_jit=False, occupancy={}):
         """Run Monte Carlo code. Hereby the number of drivers for each hour
         represent the number of MC steps. During the equilibration run, the
         trajectory is not edited until sttarting the production run. If a user
@@ -217,6 +503,38 @@ class MC:
         * **cs** - Charging station trajectory
         * **dist** - Charging station accumulated walking distance
 
+        If a directory is given for memory mapping, the trajectories are written
+        directly into numpy files **nodes.npy**, **cs.npy** and **dist.npy**
+        within this directory, and the output object file only contains the
+        links to these files. Loading the output object file opens the
+        trajectories read-only, so large trajectories do not have to be kept in
+        memory.
+
+        In statistics mode, each production week is folded into streaming
+        mean and variance accumulators of the trajectories, see
+        :func:`simemobilecity.partition.T.set_stats`, so that confidence
+        intervals of the week-to-week variation can be extracted. Optionally,
+        walking distances are counted in a histogram of the distance
+        trajectory.
+
+        Departures of parked cars are simulated using the engines
+
+        * **hour** - Each parked car leaves at the end of each hour with the leaving probability of its user
+        * **event** - The departure time of each session is drawn once on arrival and kept in a priority queue
+
+        The event engine divides each hour into the given number of time
+        slots, with drivers arriving in random slots of their hour and the
+        leaving probability distributed evenly over the slots. Sessions are
+        only processed on arrival and departure, independent of the number of
+        parked cars. Trajectories are accumulated hourly for both engines.
+
+        Optionally, the filling step of the hour engine is run by a kernel
+        compiled with Numba, see :func:`simemobilecity.kernel.fill_hour`,
+        which processes the drivers sequentially on the array form of the
+        simulation state. The kernel uses its own random state. If Numba is not
+        installed or a walking distance histogram is collected, the Python
+        implementation is used.
+
         Parameters
         ----------
         file_out : string
@@ -241,6 +559,26 @@ class MC:
         max_dist : float, optional
             Maximal allowed walking distance from charging station to node in m, for
             nodes not covered by given POI objects
+        mmap : string, optional
+            Directory for memory-mapped trajectory files, leave empty to keep
+            trajectories in memory
+        is_stats : bool, optional
+            True to collect statistics over the production weeks
+        bins : list, optional
+            Ascending bin edges in m for the walking distance histogram in
+            statistics mode, leave empty to disable the histogram
+        seed : integer, optional
+            Random seed, leave empty for a random state
+        engine : string, optional
+            Departure engine
+        slots : integer, optional
+            Number of time slots per hour for the event engine
+        is_jit : bool, optional
+            True to use the compiled kernel for the hour engine if available
+        occupancy : dictionary, optional
+            Initial charging station occupancy in the format of
+            :func:`get_occupancy`, for continuing from a previous run, leave
+            empty to start with empty stations
 
         Returns
         -------
@@ -248,43 +586,361 @@ class MC:
             Dictionary containing trajectories inputs and distance accumulation
         """
         # Process capacity
-        if capacity:
-            self._charge_G = self._topo.get_G().subgraph(capacity.keys())
-            self._capacity = capacity
-        else:
-            self._charge_G, self._capacity = self._topo.charging_station()
+        self._set_capacity(capacity)
 
-        # Process users
-        if sum([x["percent"] for x in self._users.values()]) < 100:
-            print("MC.run: ERROR - User percentages do not add up to 100...")
+        # Process inputs
+        users = self._check_inputs(p_norm)
+        if users is None:
             return
-        users = sum([[user_id for x in range(user["percent"])] for user_id, user in self._users.items()], [])
-
-        # Process normalization
-        if p_norm not in ["", "week", "day", "hour"]:
-            print("MC.run: ERROR - Wrong p_norm value - choose from \"\", \"week\", \"day\", \"hour\"...")
+        if engine not in ["hour", "event"]:
+            print("MC.run: Invalid engine...")
             return
-
-        # Process drivers
-        if not self._drivers:
-            print("MC.run: ERROR - No drivers set...")
+        if not isinstance(slots, int) or slots < 1:
+            print("MC.run: Number of slots must be a positive integer...")
             return
 
+        # Load cached results
+        key = None
+        if self._cache is not None and not mmap and not (seed is None and is_jit and kernel.IS_NUMBA):
+            assign = [self._assignment.get_k(), self._assignment.get_max_dist()] if self._assignment is not None else None
+            state = [random.getstate(), np.random.get_state()] if seed is None else None
+            key = self._cache.key("MC.run", self._topo, self._node_inputs(P(node_p), p_norm, max_dist), self._users, self._drivers, self._driver_counts, self._capacity, assign,
+                                  [weeks, weeks_equi, trials, is_stats, bins, seed, engine, slots, is_jit and kernel.IS_NUMBA, occupancy], state)
+            cached = self._cache.load(key)
+            if cached is not None:
+                self._traj = cached["traj"]
+                self._occupancy = cached["occupancy"]
+                self._station_list = None
+                if cached["state"] is not None:
+                    random.setstate(cached["state"][0])
+                    np.random.set_state(cached["state"][1])
+                if file_out:
+                    utils.save(self._traj, file_out)
+                return self._traj
+
+        # Set random seed
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
         # Prepare trajectories
         print("Starting preparation...")
+        self._mmap = mmap
+        if mmap:
+            utils.mkdirp(mmap)
         self._traj = {}
         self._traj["inp"] = {"weeks": weeks, "cs": self._capacity}
         self._prepare(P(node_p), p_norm, max_dist)
+        self._set_occupancy(occupancy)
+
+        # Enable statistics
+        self._is_stats = is_stats
+        if is_stats:
+            for name in ["nodes", "cs", "dist"]:
+                self._traj[name].set_stats(bins=bins if name=="dist" else [])
+
+        # Prepare compiled kernel
+        self._is_jit = is_jit and kernel.IS_NUMBA and engine=="hour" and not (is_stats and bins)
+        if self._is_jit:
+            self._prepare_jit(users, seed)
+
+        # Prepare event engine
+        run_helper = self._run_helper
+        if engine=="event":
+            self._prepare_events(slots)
+            run_helper = self._run_event_helper
 
         # Run equilibration
         if weeks_equi:
             print("Starting equilibration...")
-            self._run_helper(weeks_equi, users, trials, is_equi=True)
+            run_helper(weeks_equi, users, trials, is_equi=True)
 
         # Run production
         if weeks:
             print("Starting production...")
-            self._run_helper(weeks, users, trials, is_equi=False)
+            run_helper(weeks, users, trials, is_equi=False)
+
+        # Write memory-mapped trajectories
+        for name in ["nodes", "cs", "dist"]:
+            self._traj[name].flush()
+
+        # Save trajectory
+        if file_out:
+            utils.save(self._traj, file_out)
+        if key is not None:
+            state = [random.getstate(), np.random.get_state()] if seed is None else None
+            self._cache.save(key, {"traj": self._traj, "occupancy": self.get_occupancy(), "state": state})
+
+        return self._traj
+
+    def run_batch(self, file_out, capacities, weeks, weeks_equi, trials=100, node_p=0.1, p_norm="", max_dist=500, mmap="", seed=None, processes=1, is_estimate=False):
+        """Run Monte Carlo code for multiple charging station layouts, see
+        :func:`run`. The node probabilities are prepared once and reused for
+        all layouts, so that only the charging station state, the station
+        assignment and the trajectories are recomputed. Layouts can be run
+        in parallel processes, where each process receives the prepared
+        object once.
+
+        With a given random seed, all layouts are simulated with the same
+        random numbers, so that differences between the layouts are not
+        hidden by statistical noise.
+
+        Optionally, layouts are evaluated with the estimator instead, see
+        :func:`estimate`, ignoring the parameters only used by the MC code.
+
+        Parameters
+        ----------
+        file_out : string
+            file link for output object file containing the trajectory list
+        capacities : list
+            List of dictionaries containing charing station nodes and capacities
+        weeks : integer
+            Number of weeks to simulate
+        weeks_equi : integer
+            Number of weeks for equilibration
+        trials : integer, optional
+            Number of trials for faild user and node selections per driver
+        node_p : dictionary, float, optional
+            Probability of all nodes not covered by pois each hour each weekday
+        p_norm: string, optional
+            Normalize POI dicts with maximum value based on given type
+        max_dist : float, optional
+            Maximal allowed walking distance from charging station to node in m, for
+            nodes not covered by given POI objects
+        mmap : string, optional
+            Directory for memory-mapped trajectory files, each layout is stored
+            in a subdirectory named by its index
+        seed : integer, optional
+            Random seed used for each layout, leave empty for a random state
+        processes : integer, optional
+            Number of parallel processes
+        is_estimate : bool, optional
+            True to evaluate layouts with the estimator
+
+        Returns
+        -------
+        trajs : list
+            List of trajectory dictionaries in order of the given layouts
+        """
+        # Process inputs
+        if self._check_inputs(p_norm) is None:
+            return
+
+        # Prepare nodes once before distributing the object
+        self._prepare_nodes(P(node_p), p_norm, max_dist)
+
+        # Run layouts
+        if is_estimate:
+            func = _estimate_layout
+            tasks = [{"weeks": weeks, "weeks_equi": weeks_equi, "capacity": capacity, "node_p": node_p, "p_norm": p_norm, "max_dist": max_dist} for capacity in capacities]
+        else:
+            func = _run_layout
+            tasks = [{"weeks": weeks, "weeks_equi": weeks_equi, "capacity": capacity, "trials": trials, "node_p": node_p, "p_norm": p_norm,
+                      "max_dist": max_dist, "mmap": os.path.join(mmap, str(i)) if mmap else "", "seed": seed} for i, capacity in enumerate(capacities)]
+        if processes > 1:
+            trajs = utils.parallel(func, self, tasks, processes)
+        else:
+            trajs = [func(self, task) for task in tasks]
+
+        # Save trajectories
+        if file_out:
+            utils.save(trajs, file_out)
+
+        return trajs
+
+
+    def _num_drivers(self, day, hour):
+        """Get number of drivers of an hour. For a shard of the city, see
+        :func:`run_shards`, the numbers of drivers are given in advance for
+        all hours of the run and taken in order.
+
+        Parameters
+        ----------
+        day : integer
+            Day
+        hour : integer
+            Hour
+
+        Returns
+        -------
+        num_drivers : integer
+            Number of drivers
+        """
+        if self._driver_counts is not None:
+            self._driver_index += 1
+            return self._driver_counts[self._driver_index-1]
+        return self._drivers[day][hour]
+
+    def _drive(self, day, hour, users, trials, is_equi):
+        """Run filling step of a single driver. A random user and a random
+        destination node are chosen, and a session is started at the chosen
+        charging station if successful.
+
+        Parameters
+        ----------
+        day : integer
+            Day
+        hour : integer
+            Hour
+        users : list
+            List of user ids
+        trials : integer
+            Number of trials for faild user and node selections per driver
+        is_equi : bool
+            True for equilibration run to not add instances to trajectory
+
+        Returns
+        -------
+        session : tuple
+            Charging station index and user id of the started session, None if
+            no session was started
+        """
+        # Choose random user
+        user_id = random.choice(users)
+        user = self._users[user_id]["user"]
+        rand = random.uniform(0, 1)
+        # User MC step
+        for i in range(trials):
+            if rand <= user.get_p_hour(day, hour):
+                # Choose random node
+                node_id = self._nodes_draw[random.randrange(self._nodes_draw.size)]
+                node = self._node_list[node_id]
+                rand = random.uniform(0, 1)
+                # POI MC step
+                for j in range(trials):
+                    if rand <= self._nodes_p[node_id, day, hour]:
+                        # Choose charging station
+                        station_id, dist, fail = self._choose_station(node_id)
+                        dest = self._station_list[station_id] if station_id >= 0 else None
+                        ## Fail move with reason occupancy
+                        if fail=="occ":
+                            if not is_equi:
+                                self._traj["nodes"].add_fail(day, hour, node, user_id, "occ")
+                                self._traj["cs"].add_fail(day, hour, dest, user_id, "occ")
+                        ## Fail move with reason distance
+                        elif fail=="dist":
+                            if not is_equi:
+                                self._traj["nodes"].add_fail(day, hour, node, user_id, "dist")
+                                if dest is not None:
+                                    self._traj["cs"].add_fail(day, hour, dest, user_id, "dist")
+                                    self._traj["dist"].add_fail_dist(day, hour, dest, user_id, dist)
+                        ## Add session if successful
+                        else:
+                            if not is_equi:
+                                self._traj["nodes"].add_success(day, hour, node, user_id)
+                                self._traj["cs"].add_success(day, hour, dest, user_id)
+                                self._traj["dist"].add_success_dist(day, hour, dest, user_id, dist)
+                            self._station_cap[station_id, user_id] += 1
+                            self._station_tot[station_id] += 1
+                            return station_id, user_id
+                        # End node trials if successful
+                        break
+                # End user trials if successful
+                break
+
+    def run_shards(self, file_out, weeks, weeks_equi, capacity={}, trials=100, node_p=0.1, p_norm="", max_dist=500, num_x=2, num_y=2, seed=None, processes=1):
+        """Run Monte Carlo code in spatial shards of the city, that are
+        simulated independently in parallel processes. Hereby, the stations
+        are grouped by the grid cells of the topology, see
+        :func:`simemobilecity.topology.Topology.partition`, and each node
+        belongs to the shard of its nearest station. If the stations assigned
+        to a node belong to different cells, for example if the assignment
+        stores multiple stations for each node, the cells are merged into one
+        shard, so that drivers only interact with stations of their own
+        shard, see :func:`_partition`. Nodes without a station within reach
+        belong to the shard of their cell. Multiple stations per node without
+        a maximal walking distance can thereby merge all cells into a single
+        shard, which is simulated without parallelization.
+
+        Each driver heads to a shard with the share of all nodes it contains,
+        so that the drivers of each hour are split among the shards with a
+        multinomial distribution, drawn in advance for all hours of the run,
+        see :func:`_num_drivers`. Each shard has its own random state spawned
+        from the seed. The trajectories of the shards are merged into
+        trajectories of the whole city. Shards are simulated with the hour
+        engine without statistics.
+
+        Parameters
+        ----------
+        file_out : string
+            file link for output object file
+        weeks : integer
+            Number of weeks to simulate
+        weeks_equi : integer
+            Number of weeks for equilibration
+        capacity : dictionary, optional
+            Dictionary containing charing station nodes and capacities
+        trials : integer, optional
+            Number of trials for faild user and node selections per driver
+        node_p : dictionary, float, optional
+            Probability of all nodes not covered by pois each hour each weekday
+        p_norm: string, optional
+            Normalize POI dicts with maximum value based on given type
+        max_dist : float, optional
+            Maximal allowed walking distance from charging station to node in m, for
+            nodes not covered by given POI objects
+        num_x : integer, optional
+            Number of grid cells in x-direction
+        num_y : integer, optional
+            Number of grid cells in y-direction
+        seed : integer, optional
+            Random seed, from which independent random states of the shards
+            are spawned, leave empty for a random state
+        processes : integer, optional
+            Number of parallel processes
+
+        Returns
+        -------
+        traj : dictionary
+            Dictionary containing trajectories inputs and distance accumulation
+        """
+        # Process capacity
+        self._set_capacity(capacity)
+
+        # Process inputs
+        users = self._check_inputs(p_norm)
+        if users is None:
+            return
+
+        # Prepare trajectories
+        print("Starting preparation...")
+        self._mmap = ""
+        self._traj = {}
+        self._traj["inp"] = {"weeks": weeks, "cs": self._capacity}
+        self._prepare(P(node_p), p_norm, max_dist)
+
+        # Assign nodes and stations to shards
+        node_shard, station_shard = self._partition(num_x, num_y)
+
+        # Spawn random states of the shards and the driver split
+        shards = np.unique(node_shard)
+        seeds = np.random.SeedSequence(seed).spawn(shards.size+1)
+
+        # Split drivers of each hour among the shards
+        share = np.bincount(node_shard, weights=self._nodes_w, minlength=shards.max()+1)[shards]/self._nodes_draw.size
+        drivers = np.tile([self._drivers[day][hour] for day in range(7) for hour in range(24)], weeks_equi+weeks)
+        counts = np.random.default_rng(seeds[-1]).multinomial(drivers, share)
+
+        # Create shard tasks
+        tasks = []
+        for i, shard in enumerate(shards):
+            tasks.append({"nodes": np.flatnonzero(node_shard==shard), "stations": np.flatnonzero(station_shard==shard), "users": users, "drivers": counts[:, i],
+                          "weeks": weeks, "weeks_equi": weeks_equi, "trials": trials, "seed": seeds[i].generate_state(1)[0]})
+
+        # Run shards
+        print("Starting shards...")
+        if processes > 1:
+            results = utils.parallel(_run_shard, self, tasks, processes)
+        else:
+            results = [_run_shard(self, task) for task in tasks]
+
+        # Merge trajectories and occupancy
+        for task, (traj, station_cap) in zip(tasks, results):
+            self._traj["nodes"].merge(traj["nodes"], task["nodes"])
+            self._traj["cs"].merge(traj["cs"], task["stations"])
+            self._traj["dist"].merge(traj["dist"], task["stations"])
+            self._station_cap[task["stations"]] = station_cap
+        self._station_tot = self._station_cap.sum(axis=1)
 
         # Save trajectory
         if file_out:
@@ -292,6 +948,117 @@ class MC:
 
         return self._traj
 
+    def _partition(self, num_x, num_y):
+        """Assign the prepared nodes and stations to the shards of
+        :func:`run_shards`. Cells of stations assigned to the same node are
+        merged with a union-find structure. If this merges all cells into a
+        single shard, a note is printed, since the run is not parallelized.
+
+        Parameters
+        ----------
+        num_x : integer
+            Number of grid cells in x-direction
+        num_y : integer
+            Number of grid cells in y-direction
+
+        Returns
+        -------
+        node_shard : numpy.ndarray
+            Shard index of each node
+        station_shard : numpy.ndarray
+            Shard index of each station
+        """
+        # Get grid cells of nodes
+        cells = {}
+        for i, shard in enumerate(self._topo.partition(num_x, num_y)):
+            for node in shard["nodes"]:
+                cells[node] = i
+        node_cell = np.array([cells[node] for node in self._node_list], dtype=int)
+        station_cell = node_cell[[self._node_keys[station] for station in self._station_list]]
+
+        # Merge cells of stations assigned to the same node
+        parent = list(range(node_cell.max(initial=0)+1))
+        def find(x):
+            while parent[x]!=x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        for row in self._assign:
+            row = row[row >= 0]
+            for station_id in row[1:]:
+                parent[find(station_cell[station_id])] = find(station_cell[row[0]])
+
+        # Assign nodes to shards
+        node_shard = np.array([find(station_cell[row[0]]) if row[0] >= 0 else find(node_cell[i]) for i, row in enumerate(self._assign)], dtype=int)
+        station_shard = np.array([find(cell) for cell in station_cell], dtype=int)
+
+        # Check for a single shard
+        if len(parent) > 1 and np.unique(node_shard).size==1:
+            print("MC.run_shards: Stations assigned to the same nodes merge all cells into a single shard...")
+
+        return node_shard, station_shard
+
+    def _run_shard(self, task):
+        """Run shard of the city, see :func:`run_shards`. The prepared node,
+        station and assignment arrays are restricted to the shard, with station
+        indices of the assignment mapped to the shard stations.
+
+        Parameters
+        ----------
+        task : dictionary
+            Shard parameters
+
+        Returns
+        -------
+        traj : dictionary
+            Dictionary containing the shard trajectories
+        station_cap : numpy.ndarray
+            Occupancy of the shard stations at the end of the run
+        """
+        # Set random seed
+        random.seed(int(task["seed"]))
+        np.random.seed(task["seed"])
+
+        # Restrict nodes
+        nodes, stations = task["nodes"], task["stations"]
+        node_ids = np.full(len(self._node_list), -1, dtype=int)
+        node_ids[nodes] = np.arange(nodes.size)
+        nodes_draw = node_ids[self._nodes_draw]
+        self._driver_counts = task["drivers"]
+        self._driver_index = 0
+        self._node_list = [self._node_list[i] for i in nodes]
+        self._node_keys = {node: i for i, node in enumerate(self._node_list)}
+        self._nodes_p = self._nodes_p[nodes]
+        self._nodes_dist = self._nodes_dist[nodes]
+        self._nodes_w = self._nodes_w[nodes]
+        self._nodes_draw = nodes_draw[nodes_draw >= 0]
+
+        # Restrict stations
+        station_ids = np.full(len(self._station_list)+2, -2, dtype=int)
+        station_ids[stations] = np.arange(stations.size)
+        self._assign = np.where(self._assign[nodes] >= 0, station_ids[self._assign[nodes]], self._assign[nodes])
+        self._assign_dist = self._assign_dist[nodes]
+        self._station_list = [self._station_list[i] for i in stations]
+        self._station_keys = {station: i for i, station in enumerate(self._station_list)}
+        self._station_max = self._station_max[stations]
+        self._station_cap = self._station_cap[stations]
+        self._station_tot = self._station_tot[stations]
+
+        # Create trajectories
+        self._traj = {}
+        self._traj["nodes"] = T(len(self._node_list), len(self._users.keys()), node_keys=self._node_keys, dtype=int)
+        self._traj["cs"] = T(len(self._station_list), len(self._users.keys()), node_keys=self._station_keys, dtype=int)
+        self._traj["dist"] = T(len(self._station_list), len(self._users.keys()), node_keys=self._station_keys, failures=["dist"])
+
+        # Run
+        self._is_stats = False
+        self._is_jit = False
+        if task["weeks_equi"]:
+            self._run_helper(task["weeks_equi"], task["users"], task["trials"], is_equi=True)
+        if task["weeks"]:
+            self._run_helper(task["weeks"], task["users"], task["trials"], is_equi=False)
+
+        return self._traj, self._station_cap
 
     def _run_helper(self, weeks, users, trials, is_equi):
         """Run helper for processing weeks.
@@ -320,67 +1087,393 @@ class MC:
                     # Filling Step #
                     ################
                     # Run through dirvers
-                    for driver in range(self._drivers[day][hour]):
-                        # Choose random user
-                        user_id = random.choice(users)
-                        user = self._users[user_id]["user"]
-                        rand = random.uniform(0, 1)
-                        # User MC step
-                        for i in range(trials):
-                            if rand <= user.get_p_hour(day, hour):
-                                # Choose random node
-                                node = random.choice(list(self._nodes.keys()))
-                                rand = random.uniform(0, 1)
-                                # POI MC step
-                                for j in range(trials):
-                                    if rand <= self._nodes[node].get_p_hour(day, hour):
-                                        # Determine nearest charging station and calculate distance
-                                        dest, dist = self._topo.dist_poi(node, self._charge_G)
-                                        # Process success
-                                        is_success = True
-                                        ## Check occupancy and fail move if necessary with reason occupancy
-                                        if is_success and sum(self._stations[dest]["cap"])==self._stations[dest]["max"]:
-                                            if not is_equi:
-                                                self._traj["nodes"].add_fail(day, hour, node, user_id, "occ")
-                                                self._traj["cs"].add_fail(day, hour, dest, user_id, "occ")
-                                            is_success = False
-                                        ## Check distance and fail move if necessary with reason distance
-                                        if is_success and dist > self._nodes_dist[node]:
-                                            if not is_equi:
-                                                self._traj["nodes"].add_fail(day, hour, node, user_id, "dist")
-                                                self._traj["cs"].add_fail(day, hour, dest, user_id, "dist")
-                                                self._traj["dist"].add_fail_dist(day, hour, dest, user_id, dist)
-                                            is_success = False
-                                        ## Add session if successful
-                                        if is_success:
-                                            if not is_equi:
-                                                self._traj["nodes"].add_success(day, hour, node, user_id)
-                                                self._traj["cs"].add_success(day, hour, dest, user_id)
-                                                self._traj["dist"].add_success_dist(day, hour, dest, user_id, dist)
-                                            self._stations[dest]["cap"][user_id] += 1
-                                        # End node trials if successful
-                                        break
-                                # End user trials if successful
-                                break
+                    num_drivers = self._num_drivers(day, hour)
+                    if self._is_jit:
+                        self._fill_jit(day, hour, num_drivers, is_equi)
+                    else:
+                        for driver in range(num_drivers):
+                            self._drive(day, hour, users, trials, is_equi)
 
                     ##############
                     # Empty Step #
                     ##############
-                    # Run through stations
-                    for station in self._stations.values():
-                        # Run through users
-                        for user_id in self._users.keys():
-                            # Get leaving probability
-                            user = self._users[user_id]["user"]
-                            p_leave = 1-user.get_p_hour(day, hour)
-                            # Run through users parking
-                            for i in range(station["cap"][user_id]):
-                                rand = random.uniform(0, 1)
-                                # Check if user leaves
-                                if rand < p_leave:
-                                    station["cap"][user_id] -= 1
+                    # Draw number of leaving users for all stations and users at once
+                    p_leave = 1-self._users_p[:, day, hour]
+                    leave = np.random.binomial(self._station_cap, p_leave)
+                    self._station_cap -= leave
+                    self._station_tot -= leave.sum(axis=1)
 
                 # Progress
                 sys.stdout.write("Finished day "+progress_form%(week*7+day+1)+"/"+progress_form%(weeks*7)+"...\r")
                 sys.stdout.flush()
+
+            # Add week to statistics
+            if self._is_stats and not is_equi:
+                for name in ["nodes", "cs", "dist"]:
+                    self._traj[name].fold()
         print()
+
+    def _prepare_jit(self, users, seed):
+        """Prepare compiled kernel. The kernel uses the station assignment
+        table determined for all nodes beforehand, see
+        :func:`_prepare_stations`, and value arrays are created for an hour of
+        each trajectory.
+
+        Parameters
+        ----------
+        users : list
+            List of user ids
+        seed : integer
+            Random seed, None for a random state
+        """
+        # Set kernel random state
+        if seed is not None:
+            kernel.seed(seed)
+
+        # Create arrays
+        num_users = len(self._users.keys())
+        self._users_list = np.array(users, dtype=int)
+        self._val = {"nodes": np.zeros((len(self._node_list), 3, num_users), dtype=int),
+                     "cs": np.zeros((len(self._station_list), 3, num_users), dtype=int),
+                     "dist": np.zeros((len(self._station_list), 2, num_users))}
+
+    def _fill_jit(self, day, hour, num_drivers, is_equi):
+        """Run filling step of an hour with the compiled kernel and add the
+        values to the trajectories.
+
+        Parameters
+        ----------
+        day : integer
+            Day
+        hour : integer
+            Hour
+        num_drivers : integer
+            Number of drivers
+        is_equi : bool
+            True for equilibration run to not add instances to trajectory
+        """
+        # Run kernel
+        kernel.fill_hour(num_drivers, self._users_list, self._users_p[:, day, hour].copy(), self._nodes_p[:, day, hour].copy(), self._nodes_draw,
+                         self._assign, self._assign_dist, self._nodes_dist, self._station_max, self._station_tot, self._station_cap,
+                         self._val["nodes"], self._val["cs"], self._val["dist"], is_equi)
+
+        # Add values to trajectories
+        if not is_equi:
+            for name, val in self._val.items():
+                self._traj[name].add_hour(day, hour, val)
+                val.fill(0)
+
+    def _prepare_events(self, slots):
+        """Prepare event engine. The probability of staying parked each time
+        slot is the hourly probability of the user distributed evenly over the
+        slots of the hour. The negative logarithm of the staying probability is
+        accumulated over the slots of a week for each user, so that the
+        departure slot of a session can be drawn with a single random number
+        using a binary search.
+
+        Parameters
+        ----------
+        slots : integer
+            Number of time slots per hour
+        """
+        # Cumulative hazard over slots of a week for each user
+        p_stay = np.repeat(self._users_p.reshape(len(self._users.keys()), 7*24), slots, axis=1)**(1/slots)
+        hazard = -np.log(np.maximum(p_stay, 1e-300))
+        self._hazard = np.concatenate([np.zeros((hazard.shape[0], 1)), np.cumsum(hazard, axis=1)], axis=1)
+
+        # Initialize event queue
+        self._slots = slots
+        self._slot = 0
+        self._departures = []
+
+        # Draw departures of initially parked cars
+        for station_id, user_id in zip(*np.nonzero(self._station_cap)):
+            for session in range(self._station_cap[station_id, user_id]):
+                slot = self._depart(0, user_id)
+                if slot is not None:
+                    heapq.heappush(self._departures, (slot, station_id, user_id))
+
+    def _depart(self, slot, user_id):
+        """Draw departure slot of a session starting in the given slot. The
+        session ends at the end of the first slot, where the accumulated
+        hazard since the start exceeds an exponentially distributed random
+        number.
+
+        Parameters
+        ----------
+        slot : integer
+            Absolute slot of session start
+        user_id : integer
+            User id
+
+        Returns
+        -------
+        slot : integer
+            Absolute slot at the end of which the session ends, None if the
+            session never ends
+        """
+        # Initialize
+        hazard = self._hazard[user_id]
+        num_slots = hazard.size-1
+        week_slot = slot % num_slots
+
+        # Users never leaving
+        if hazard[-1]==0:
+            return None
+
+        # Find slot reaching the drawn hazard
+        weeks, rest = divmod(hazard[week_slot]+random.expovariate(1), hazard[-1])
+        return slot-week_slot+int(weeks)*num_slots+int(np.searchsorted(hazard, rest))-1
+
+    def _run_event_helper(self, weeks, users, trials, is_equi):
+        """Run helper for processing weeks with the event engine. Drivers of
+        each hour are distributed randomly over the slots of the hour. Each
+        started session is added to a priority queue with its departure slot,
+        and sessions are removed at the end of their departure slot.
+
+        Parameters
+        ----------
+        weeks : int
+            Number of weeks to run
+        users : dictionary
+            User dictionary
+        trials : integer
+            Number of trials for faild user and node selections per driver
+        is_equi : bool
+            True for equilibration run to not add instances to trajectory
+        """
+        # Initialize
+        progress_form = "%"+str(len(str(weeks*7)))+"i"
+
+        # Run through weeks
+        for week in range(weeks):
+            # Run through days
+            for day in range(7):
+                # Run through hours
+                for hour in range(24):
+                    # Distribute drivers over slots
+                    drivers = np.random.multinomial(self._num_drivers(day, hour), [1/self._slots]*self._slots)
+                    for num in drivers:
+                        # Run through drivers
+                        for driver in range(num):
+                            session = self._drive(day, hour, users, trials, is_equi)
+                            if session is not None:
+                                slot = self._depart(self._slot, session[1])
+                                if slot is not None:
+                                    heapq.heappush(self._departures, (slot, session[0], session[1]))
+
+                        # End sessions of current slot
+                        while self._departures and self._departures[0][0] <= self._slot:
+                            slot, station_id, user_id = heapq.heappop(self._departures)
+                            self._station_cap[station_id, user_id] -= 1
+                            self._station_tot[station_id] -= 1
+                        self._slot += 1
+
+                # Progress
+                sys.stdout.write("Finished day "+progress_form%(week*7+day+1)+"/"+progress_form%(weeks*7)+"...\r")
+                sys.stdout.flush()
+
+            # Add week to statistics
+            if self._is_stats and not is_equi:
+                for name in ["nodes", "cs", "dist"]:
+                    self._traj[name].fold()
+        print()
+
+
+    ##################
+    # Getter Methods #
+    ##################
+    def get_assignment(self):
+        """Return station assignment object.
+
+        Returns
+        -------
+        assign : Assignment
+            Assignment object, None if the nearest stations are assigned by
+            default
+        """
+        return self._assignment
+
+    def get_occupancy(self):
+        """Return charging station occupancy at the end of the last run.
+
+        Returns
+        -------
+        occupancy : dictionary
+            Dictionary of charging station nodes with a list of the number of
+            parked cars for each user type
+        """
+        if self._occupancy is not None:
+            return self._occupancy
+        return {station: self._station_cap[i].tolist() for i, station in enumerate(self._station_list)}
+
+    def estimate(self, file_out, weeks, weeks_equi, capacity={}, node_p=0.1, p_norm="", max_dist=500):
+        """Estimate expected occupancy failures and successes deterministically
+        as a fast alternative to the Monte Carlo code. Hereby the expected
+        number of drivers arriving at each node is determined from the number
+        of drivers, user percentages and probabilities, and node probabilities.
+        Arrivals are propagated to the nearest charging station of the station
+        assignment, where the expected occupancy of each user type decreases
+        each hour with the leaving probability of the user.
+
+        The probability of a station being fully occupied is approximated by
+        the Erlang-B formula, see :func:`simemobilecity.queueing.erlang_b`,
+        using the expected occupancy and the expected arrivals as offered
+        load. Failures due to occupancy and distance are determined in the
+        order of the Monte Carlo code. Only the nearest station of each node
+        is considered.
+
+        The Erlang-B formula assumes that the occupancy carried over from
+        previous hours is offered load like the new arrivals, although these
+        cars occupy their charging points with certainty. Compared to the
+        Monte Carlo code, occupancy failures are therefore underestimated, the
+        more the heavier the load and the longer cars stay parked. The
+        estimate is exact for the first hour of empty stations.
+
+        The resulting trajectories contain the expected values for the given
+        number of weeks, after the given number of equilibration weeks for
+        reaching a periodic occupancy.
+
+        Parameters
+        ----------
+        file_out : string
+            file link for output object file
+        weeks : integer
+            Number of weeks the expected values are scaled to
+        weeks_equi : integer
+            Number of weeks for equilibration
+        capacity : dictionary, optional
+            Dictionary containing charing station nodes and capacities
+        node_p : dictionary, float, optional
+            Probability of all nodes not covered by pois each hour each weekday
+        p_norm: string, optional
+            Normalize POI dicts with maximum value based on given type
+        max_dist : float, optional
+            Maximal allowed walking distance from charging station to node in m, for
+            nodes not covered by given POI objects
+
+        Returns
+        -------
+        traj : dictionary
+            Dictionary containing trajectories of expected values and inputs
+        """
+        # Process capacity
+        self._set_capacity(capacity)
+
+        # Process inputs
+        if self._check_inputs(p_norm) is None:
+            return
+
+        # Prepare trajectories
+        self._mmap = ""
+        self._traj = {}
+        self._traj["inp"] = {"weeks": weeks, "cs": self._capacity}
+        self._prepare(P(node_p), p_norm, max_dist, dtype=float)
+
+        # Get nearest stations
+        station = self._assign[:, 0]
+        dist = self._assign_dist[:, 0]
+        is_station = station >= 0
+        is_near = is_station & (dist <= self._nodes_dist)
+
+        # Initialize
+        num_nodes = len(self._node_list)
+        num_users = len(self._users.keys())
+        share = np.array([user["percent"] for user in self._users.values()])/100
+        occ = np.zeros((len(self._station_list), num_users))
+
+        # Run through weeks
+        for week in range(weeks_equi+1):
+            for day in range(7):
+                for hour in range(24):
+                    # Expected arrivals at nodes and stations
+                    arrive = self._drivers[day][hour]/self._nodes_draw.size*np.outer(self._nodes_w*self._nodes_p[:, day, hour], share*self._users_p[:, day, hour])
+                    arrive_near = np.zeros(occ.shape)
+                    np.add.at(arrive_near, station[is_near], arrive[is_near])
+
+                    # Blocking probability
+                    block = erlang_b(self._station_max, occ.sum(axis=1)+arrive_near.sum(axis=1))
+                    block_node = np.where(is_station, block[station], 0)
+
+                    # Add expected values to trajectories
+                    if week==weeks_equi and weeks:
+                        val_nodes = np.zeros((num_nodes, 3, num_users))
+                        val_nodes[:, 0] = arrive*((1-block_node)*is_near)[:, np.newaxis]
+                        val_nodes[:, 1] = arrive*(block_node*is_near)[:, np.newaxis]
+                        val_nodes[:, 2] = arrive*(~is_near)[:, np.newaxis]
+                        val_cs = np.zeros((len(self._station_list), 3, num_users))
+                        np.add.at(val_cs, station[is_station], val_nodes[is_station])
+                        val_dist = np.zeros((len(self._station_list), 2, num_users))
+                        np.add.at(val_dist, station[is_station], val_nodes[is_station][:, [0, 2]]*dist[is_station, np.newaxis, np.newaxis])
+                        self._traj["nodes"].add_hour(day, hour, weeks*val_nodes)
+                        self._traj["cs"].add_hour(day, hour, weeks*val_cs)
+                        self._traj["dist"].add_hour(day, hour, weeks*val_dist)
+
+                    # Fill and empty stations
+                    occ = (occ+arrive_near*(1-block)[:, np.newaxis])*self._users_p[:, day, hour]
+
+        # Save trajectory
+        if file_out:
+            utils.save(self._traj, file_out)
+
+        return self._traj
+
+
+def _run_layout(mc, task):
+    """Helper function for running a charging station layout in a worker
+    process.
+
+    Parameters
+    ----------
+    mc : MC
+        Prepared MC object
+    task : dictionary
+        Run parameters
+
+    Returns
+    -------
+    traj : dictionary
+        Trajectory dictionary
+    """
+    return mc.run("", **task)
+
+
+def _estimate_layout(mc, task):
+    """Helper function for estimating a charging station layout in a worker
+    process.
+
+    Parameters
+    ----------
+    mc : MC
+        Prepared MC object
+    task : dictionary
+        Estimator parameters
+
+    Returns
+    -------
+    traj : dictionary
+        Trajectory dictionary
+    """
+    return mc.estimate("", **task)
+
+
+def _run_shard(mc, task):
+    """Helper function for running a shard of the city in a worker process.
+    The MC object is copied, so that restricting it to the shard does not
+    change the shared object.
+
+    Parameters
+    ----------
+    mc : MC
+        Prepared MC object
+    task : dictionary
+        Shard parameters
+
+    Returns
+    -------
+    traj : dictionary
+        Dictionary containing the shard trajectories
+    station_cap : numpy.ndarray
+        Occupancy of the shard stations at the end of the run
+    """
+    return copy.copy(mc)._run_shard(task)
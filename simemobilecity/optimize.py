@@ -7,10 +7,25 @@
 
 import sys
 import copy
+import heapq
 import random
 
+import numpy as np
+
+from scipy.sparse import csr_matrix, hstack, identity, vstack
+
+try:
+    from scipy.optimize import milp, Bounds, LinearConstraint
+    IS_MILP = True
+except ImportError:
+    IS_MILP = False
+
 import simemobilecity.utils as utils
 
+from simemobilecity.queueing import erlang_b_load, erlang_b_capacity
+from simemobilecity.spacing import Spacing
+from simemobilecity.assignment import Assignment
+
 
 class Optimize:
     """Run optimization
@@ -23,13 +38,322 @@ class Optimize:
     def __init__(self, topo):
         # Initialize
         self._topo = topo
+        self._cache = None
+
+
+    ###################
+    # Private Methods #
+    ###################
+    def _coverage(self, traj, cap, max_dist, min_dist):
+        """Determine failed demand and candidate coverage. The demand of each
+        node is the number of attempts failing due to distance in the node
+        trajectory. Candidates are all nodes within the maximal walking distance
+        of a demand node, which cover the demand nodes within this distance.
+        Candidates within the minimal distance of an existing charging station
+        are excluded.
+
+        Parameters
+        ----------
+        traj : dictionary
+            Simulation trajectory of the mc code - includes the **nodes** entry
+        cap : dictionary
+            Dictionary of charging station nodes and capacities
+        max_dist : float
+            Maximal walking distance in m from a node to a new charging station
+        min_dist : float
+            Minimal distance of new charging stations in m
+
+        Returns
+        -------
+        demand : dictionary
+            Dictionary of demand nodes and number of failed attempts
+        cover : dictionary
+            Dictionary of candidate nodes and the list of demand nodes they cover
+        """
+        # Get failed demand
+        extract = traj["nodes"].extract(range(traj["nodes"].get_num_days()), range(traj["nodes"].get_num_hours()), range(traj["nodes"].get_num_users()), is_norm=False)
+        demand = {node: data["fail"]["dist"] for node, data in extract.items() if data["fail"]["dist"]}
+
+        # Get nodes blocked by existing stations
+        blocked = set(cap.keys())
+        for nodes in self._topo.rings(list(cap.keys()), min_dist, -1).values():
+            blocked.update(nodes)
+
+        # Get candidates covering demand nodes
+        cover = {}
+        for node, nodes in self._topo.rings(list(demand.keys()), max_dist, -1).items():
+            for candidate in nodes:
+                if candidate not in blocked:
+                    cover.setdefault(candidate, []).append(node)
+
+        return demand, cover
+
+    def _size(self, extract, cap, thresh):
+        """Size charging station capacities for occupancy failures using the
+        Erlang-B model, see :mod:`simemobilecity.queueing`. For each station
+        exceeding the critical occupancy failure, the offered load is fitted to
+        the observed fraction of blocked attempts among all attempts reaching
+        the station at its current capacity. Since the occupancy is checked
+        before the walking distance, distance failures are attempts that found
+        a free charging point and are counted as not blocked. The new capacity is the smallest
+        capacity with a blocking probability not exceeding the critical value.
+        All stations are processed at once.
+
+        Parameters
+        ----------
+        extract : dictionary
+            Extracted charging station trajectory, see
+            :func:`simemobilecity.partition.T.extract`
+        cap : dictionary
+            Dictionary of charging station nodes and capacities
+        thresh : float
+            Critical value of occupancy failures
+
+        Returns
+        -------
+        sizes : dictionary
+            Dictionary of charging station nodes and new capacities for
+            stations exceeding the critical value
+        """
+        # Get stations exceeding critical value
+        nodes, capacity, block = [], [], []
+        for node, data in extract.items():
+            tot_sessions = data["success"]+data["fail"]["dist"]+data["fail"]["occ"]
+            if node in cap.keys() and data["fail"]["occ"] and data["fail"]["occ"]/tot_sessions > thresh:
+                nodes.append(node)
+                capacity.append(cap[node])
+                block.append(data["fail"]["occ"]/tot_sessions)
+
+        # Fit offered load and size capacity
+        load = erlang_b_load(np.array(capacity, dtype=int), np.minimum(block, 0.999))
+        sizes = erlang_b_capacity(load, thresh)
+
+        return {node: max(int(size), cap[node]) for node, size in zip(nodes, sizes)}
+
+    def _greedy(self, cap, demand, cover, budget, min_dist):
+        """Place new charging stations greedily maximizing the covered demand.
+        Marginal gains are evaluated lazily using a priority queue - since gains
+        can only decrease, a candidate whose recomputed gain remains on top of
+        the queue is the best candidate. Candidates within the minimal distance
+        of a placed station are removed.
+
+        Parameters
+        ----------
+        cap : dictionary
+            Dictionary of charging station nodes and capacities, new stations
+            are added with two charging points
+        demand : dictionary
+            Dictionary of demand nodes and number of failed attempts
+        cover : dictionary
+            Dictionary of candidate nodes and the list of demand nodes they cover
+        budget : integer
+            Maximal number of new charging stations, None for no limit
+        min_dist : float
+            Minimal distance of new charging stations in m
+        """
+        # Initialize
+        covered = set()
+        blocked = set()
+        heap = [(-sum(demand[node] for node in nodes), candidate) for candidate, nodes in cover.items()]
+        heapq.heapify(heap)
+
+        # Place stations
+        num = 0
+        while heap and (budget is None or num < budget):
+            gain, candidate = heapq.heappop(heap)
+            if candidate in blocked:
+                continue
+
+            # Recompute gain and reinsert if not on top anymore
+            gain = sum(demand[node] for node in cover[candidate] if node not in covered)
+            if gain <= 0:
+                continue
+            if heap and gain < -heap[0][0]:
+                heapq.heappush(heap, (-gain, candidate))
+                continue
+
+            # Add new charging station
+            cap[candidate] = 2
+            covered.update(cover[candidate])
+            blocked.update(self._topo.ring(candidate, min_dist, -1))
+            num += 1
+
+
+    def _milp(self, cap, demand, cover, budget, min_dist):
+        """Place new charging stations maximizing the covered demand by solving
+        the maximal coverage problem as mixed integer linear program with
+        :func:`scipy.optimize.milp`, which requires SciPy 1.9 or newer. Binary
+        variables choose candidates and continuous variables mark covered
+        demand nodes, which are bounded by the sum of chosen candidates
+        covering them. Candidates within the minimal distance of each other can
+        not be chosen together. Without a budget, each chosen candidate is
+        penalized by a small fraction of the smallest demand, so that no
+        redundant stations are placed.
+
+        The problem is reduced beforehand by keeping only one of the candidates
+        covering the same demand nodes and conflicting with the same other
+        candidates, since these are interchangeable in any solution, and
+        combining demand nodes covered by the same candidates. All constraints
+        are assembled as sparse matrices.
+
+        Parameters
+        ----------
+        cap : dictionary
+            Dictionary of charging station nodes and capacities, new stations
+            are added with two charging points
+        demand : dictionary
+            Dictionary of demand nodes and number of failed attempts
+        cover : dictionary
+            Dictionary of candidate nodes and the list of demand nodes they cover
+        budget : integer
+            Maximal number of new charging stations, None for no limit
+        min_dist : float
+            Minimal distance of new charging stations in m
+        """
+        # Get candidates within minimal distance of each other
+        conflicts = {candidate: set() for candidate in cover}
+        for candidate, nodes in self._topo.rings(list(cover.keys()), min_dist, -1).items():
+            for node in nodes:
+                if node in conflicts and node!=candidate:
+                    conflicts[candidate].add(node)
+                    conflicts[node].add(candidate)
+
+        # Prune interchangeable candidates with same coverage and conflicts
+        cover_sets = {}
+        for candidate, nodes in cover.items():
+            twins = cover_sets.setdefault(frozenset(nodes), [])
+            if not any(conflicts[candidate]-{twin}==conflicts[twin]-{candidate} for twin in twins):
+                twins.append(candidate)
+        candidates = [candidate for twins in cover_sets.values() for candidate in twins]
+        if not candidates:
+            return
+
+        # Combine demand nodes covered by same candidates
+        groups = {}
+        for j, candidate in enumerate(candidates):
+            for node in set(cover[candidate]):
+                groups.setdefault(node, []).append(j)
+        group_keys = {}
+        weights = []
+        rows, cols = [], []
+        for node, ids in groups.items():
+            key = tuple(ids)
+            if key not in group_keys:
+                group_keys[key] = len(weights)
+                weights.append(0)
+                rows += [group_keys[key]]*len(ids)
+                cols += ids
+            weights[group_keys[key]] += demand[node]
+        num_c, num_d = len(candidates), len(weights)
+
+        # Coverage constraints y_i - sum_j a_ij x_j <= 0
+        cover_matrix = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_d, num_c))
+        matrices = [hstack([-cover_matrix, identity(num_d)])]
+        upper = [np.zeros(num_d)]
+
+        # Budget constraint
+        if budget is not None:
+            matrices.append(csr_matrix(np.concatenate([np.ones(num_c), np.zeros(num_d)])))
+            upper.append(np.array([budget]))
+
+        # Spacing constraints x_j + x_k <= 1
+        keys = {candidate: j for j, candidate in enumerate(candidates)}
+        pairs = set()
+        for candidate in candidates:
+            for node in conflicts[candidate]:
+                if node in keys:
+                    pairs.add((min(keys[candidate], keys[node]), max(keys[candidate], keys[node])))
+        if pairs:
+            pairs = np.array(sorted(pairs))
+            rows = np.repeat(np.arange(pairs.shape[0]), 2)
+            matrices.append(csr_matrix((np.ones(rows.size), (rows, pairs.ravel())), shape=(pairs.shape[0], num_c+num_d)))
+            upper.append(np.ones(pairs.shape[0]))
+
+        # Solve
+        penalty = 0 if budget is not None else min(weights)/(num_c+1)
+        objective = np.concatenate([np.full(num_c, penalty), -np.array(weights, dtype=float)])
+        integrality = np.concatenate([np.ones(num_c), np.zeros(num_d)])
+        constraints = LinearConstraint(vstack(matrices).tocsr(), -np.inf, np.concatenate(upper))
+        result = milp(objective, integrality=integrality, bounds=Bounds(0, 1), constraints=constraints)
+        if result.x is None:
+            print("Optimize.run: MILP solver failed - "+result.message)
+            return
+
+        # Add new charging stations
+        for j in np.flatnonzero(result.x[:num_c] > 0.5):
+            cap[candidates[j]] = 2
+
+
+    def _summary(self, traj):
+        """Summarize trajectory of a simulation round.
+
+        Parameters
+        ----------
+        traj : dictionary
+            Simulation trajectory of the mc code
+
+        Returns
+        -------
+        summary : dictionary
+            Dictionary containing the number of stations **stations**, number
+            of charging points **cp**, the total fractions of successful
+            attempts **success** and of the failures, and the largest failure
+            fractions of a station **max**
+        """
+        # Extract station data
+        extract = traj["cs"].extract(range(traj["cs"].get_num_days()), range(traj["cs"].get_num_hours()), range(traj["cs"].get_num_users()), is_norm=False)
+        failures = traj["cs"].get_failures()
+        tot = {"success": sum(data["success"] for data in extract.values())}
+        tot.update({fail: sum(data["fail"][fail] for data in extract.values()) for fail in failures})
+        tot_sessions = sum(tot.values())
+
+        # Largest station failure fractions
+        max_fail = {fail: 0 for fail in failures}
+        for data in extract.values():
+            tot_node = data["success"]+sum(data["fail"].values())
+            for fail in failures:
+                max_fail[fail] = max(max_fail[fail], data["fail"][fail]/tot_node if tot_node else 0)
+
+        # Build summary
+        summary = {"stations": len(traj["inp"]["cs"]), "cp": sum(traj["inp"]["cs"].values())}
+        summary.update({key: val/tot_sessions if tot_sessions else 0 for key, val in tot.items()})
+        summary["max"] = max_fail
+
+        return summary
 
 
     ##################
     # Public Methods #
     ##################
-    def run(self, file_out, traj, crit={"dist": 0.15, "occ": 0.15}, max_cp=2, min_dist=150, trials=1000):
-        """Run optimization.
+    def set_cache(self, cache):
+        """Set result cache. Optimizations with identical inputs, including
+        the topology, trajectory, parameters and the state of the random
+        number generator in random mode, are loaded from the cache. In random
+        mode, the random number generator is set to the state after the
+        optimization when loading from the cache, so that consecutive
+        optimizations still differ.
+
+        Parameters
+        ----------
+        cache : Cache
+            Cache object, None to disable caching
+        """
+        self._cache = cache
+
+    def run(self, file_out, traj, crit={"dist": 0.15, "occ": 0.15}, max_cp=2, min_dist=150, trials=1000, mode="random", budget=None, max_dist=500, sizing="rule"):
+        """Run optimization. Charging points are added to stations exceeding
+        the critical occupancy failure. New charging stations for distance
+        failures are placed using the modes
+
+        * **random** - For each station exceeding the critical distance failure, random nodes between the minimal and the mean failure distance are chosen
+        * **greedy** - Stations are placed greedily at the nodes covering the most failed attempts of the node trajectory within the maximal walking distance, see :func:`_greedy`
+        * **milp** - Stations are placed covering the most failed attempts of the node trajectory within the maximal walking distance as exact solution of a mixed integer linear program, requiring SciPy 1.9 or newer, see :func:`_milp`
+
+        Charging points for occupancy failures are added using the sizing
+        types
+
+        * **rule** - The number of charging points is increased by the failure fraction times the capacity, limited by the maximal number of charging points to add
+        * **erlang** - The capacity is set to the smallest capacity meeting the critical value using the Erlang-B model, see :func:`_size`
 
         Parameters
         ----------
@@ -43,15 +367,51 @@ class Optimize:
         max_cp : integer, optional
             Maximal number of charging stations to add to a node
         min_dist : float, optional
-            Minimal distance for adding new charging stations
+            Minimal distance for adding new charging stations, new stations in
+            random mode keep this distance to all stations, see
+            :class:`simemobilecity.spacing.Spacing`
         trials : integer, optional
             Number of trials for choosing random node
+        mode : string, optional
+            Placement mode for new charging stations
+        budget : integer, optional
+            Maximal number of new charging stations in greedy and milp mode,
+            leave empty for no limit
+        max_dist : float, optional
+            Maximal walking distance in m from a node to a new charging station
+            in greedy and milp mode
+        sizing : string, optional
+            Sizing type for occupancy failures
 
         Returns
         -------
         cs : dictionary
             Dictionary of node ids and capacity for the charging stations
         """
+        # Process mode
+        if mode not in ["random", "greedy", "milp"]:
+            print("Optimize.run: Invalid mode...")
+            return
+        if mode=="milp" and not IS_MILP:
+            print("Optimize.run: ERROR - Mode milp requires SciPy 1.9 or newer...")
+            return
+        if sizing not in ["rule", "erlang"]:
+            print("Optimize.run: Invalid sizing...")
+            return
+
+        # Load cached results
+        key = None
+        if self._cache is not None:
+            key = self._cache.key("Optimize.run", self._topo, traj, crit, [max_cp, min_dist, trials, mode, budget, max_dist, sizing],
+                                  random.getstate() if mode=="random" else None)
+            cached = self._cache.load(key)
+            if cached is not None:
+                if cached["state"] is not None:
+                    random.setstate(cached["state"])
+                if file_out:
+                    utils.save(cached["cs"], file_out)
+                return cached["cs"]
+
         # Initialize
         num_weeks = traj["inp"]["weeks"]
         num_days = traj["cs"].get_num_days()
@@ -72,6 +432,25 @@ class Optimize:
         if not len(cap)==traj["cs"].get_num_nodes():
             print("Warning - Number of charging station capcity list is not equal to number of charging stations in given trajectory. Missing ones will be ignored.")
 
+        # Get nodes within distance ring of charging stations failing due to distance
+        rings = {}
+        if "dist" in crit and mode=="random":
+            nodes, mean_dists = [], []
+            for node, data in extract.items():
+                if node in cap.keys() and data["fail"]["dist"]:
+                    tot_sessions = data["success"]+data["fail"]["dist"]+data["fail"]["occ"]
+                    mean_dist = distances[node]["fail"]["dist"]/data["fail"]["dist"]
+                    if data["fail"]["dist"]/tot_sessions > crit["dist"] and mean_dist>min_dist:
+                        nodes.append(node)
+                        mean_dists.append(mean_dist)
+            rings = self._topo.rings(nodes, mean_dists, min_dist)
+
+        # Size capacities for occupancy failures
+        sizes = self._size(extract, cap, crit["occ"]) if sizing=="erlang" and "occ" in crit else {}
+
+        # Check spacing of new stations to all stations
+        spacing = Spacing(self._topo, list(cap.keys()), min_dist)
+
         # Run through nodes
         run_id = 0
         for node, data in extract.items():
@@ -90,41 +469,242 @@ class Optimize:
                         # Occupancy optimization - Add for charging points
                         if failure=="occ":
                             # Add charging points with number of mean failures
-                            cap[node] += add_cp
+                            if sizing=="rule":
+                                cap[node] += add_cp
+                            # Set analytically sized capacity
+                            else:
+                                cap[node] = sizes[node]
 
                         # Distance fail - Add
-                        elif failure=="dist":
-                            # Calculate mean failure distance
-                            mean_dist = distances[node]["fail"]["dist"]/data["fail"]["dist"] if data["fail"][failure] else 0
+                        elif failure=="dist" and mode=="random":
                             # Check if mean distance is larger than given minimum
-                            if mean_dist>min_dist:
-                                # Get nodes within radius
-                                node_r = self._topo.radius(node, mean_dist)
-                                node_r_min = self._topo.radius(node, min_dist)
-                                # Remove nodes within minimal distance
-                                node_r = [x for x in node_r if x not in node_r_min]
-                                # Check if list has elements
-                                if node_r:
-                                    # Run through half the number of failed attempts
-                                    for i in range(int(add_cp/2)):
-                                        # Iterate random choices
-                                        for j in range(trials):
-                                            # Choose random node
-                                            node_rand = random.choice(node_r)
-                                            # Check if already charginng station
-                                            if node_rand not in cap.keys():
-                                                # Add new charging station
-                                                cap[node_rand] = 2
-                                                # End trials if successfull
-                                                break
+                            if node in rings:
+                                # Get nodes between minimal and mean failure distance far enough from all stations
+                                node_r = spacing.filter(rings[node])
+                                # Run through half the number of failed attempts
+                                for i in range(int(add_cp/2)):
+                                    # Iterate random choices
+                                    for j in range(trials):
+                                        # Check if list has elements
+                                        if not node_r:
+                                            break
+                                        # Choose random node
+                                        node_rand = random.choice(node_r)
+                                        # Check spacing to stations added in the meantime
+                                        if spacing.is_free(node_rand):
+                                            # Add new charging station
+                                            cap[node_rand] = 2
+                                            spacing.add(node_rand)
+                                            # End trials if successfull
+                                            break
+                                        # Remove rejected node
+                                        node_r.remove(node_rand)
 
             # Progress
             sys.stdout.write("Finished node "+progress_form%(run_id)+"/"+progress_form%(num_nodes)+"...\r")
             sys.stdout.flush()
         print()
 
+        # Place new charging stations covering failed demand
+        if mode in ["greedy", "milp"]:
+            demand, cover = self._coverage(traj, cap, max_dist, min_dist)
+            if mode=="greedy":
+                self._greedy(cap, demand, cover, budget, min_dist)
+            else:
+                self._milp(cap, demand, cover, budget, min_dist)
+
         # Save trajectory
         if file_out:
             utils.save(cap, file_out)
+        if key is not None:
+            self._cache.save(key, {"cs": cap, "state": random.getstate() if mode=="random" else None})
 
         return cap
+
+    def loop(self, file_out, mc, capacity, weeks, weeks_equi, weeks_warm=0, rounds=10, budget=None, crit={"dist": 0.15, "occ": 0.15}, kwargs={"mc": {}, "opt": {}}):
+        """Alternate optimization and simulation until the failure fractions
+        of all charging stations are below the critical values, the number of
+        rounds or the budget of new charging stations is exhausted, or the
+        optimization does not change the stations anymore.
+
+        Each simulation round after the first continues from the charging
+        station occupancy of the previous round, so that fewer equilibration
+        weeks are needed. Node probabilities prepared by the MC object are
+        reused, and the station assignment is updated incrementally, see
+        :class:`simemobilecity.assignment.Assignment`. If the MC object has no
+        assignment, a network distance assignment with the nearest station is
+        set during the loop, and the previous assignment is restored at the
+        end. Intermediate trajectories are not saved.
+
+        Parameters
+        ----------
+        file_out : string
+            file link for output object file
+        mc : MC
+            MC object with users, pois and drivers set
+        capacity : dictionary
+            Dictionary of initial charging station nodes and capacities
+        weeks : integer
+            Number of weeks to simulate each round
+        weeks_equi : integer
+            Number of weeks for equilibration in the first round
+        weeks_warm : integer, optional
+            Number of weeks for equilibration in the following rounds
+        rounds : integer, optional
+            Maximal number of optimization rounds
+        budget : integer, optional
+            Maximal total number of new charging stations, leave empty for no
+            limit, requires the greedy or milp optimization mode, which is the
+            greedy mode by default
+        crit : dictionary, optional
+            Critical values of failures at which to optimize charging station capacities
+        kwargs : dictionary, optional
+            Dictionary with further parameters for the simulation **mc**, see
+            :func:`simemobilecity.mc.MC.run`, and the optimization **opt**, see
+            :func:`run`, overriding the critical values for the optimization,
+            a budget given for the optimization limits each round
+
+        Returns
+        -------
+        results : dictionary
+            Dictionary containing the final capacities **cs**, final
+            trajectory **traj** and a list of round summaries **summary**, see
+            :func:`_summary`
+        """
+        # Initialize
+        kwargs_mc = kwargs["mc"] if "mc" in kwargs else {}
+        kwargs_opt = {"crit": crit, "mode": "greedy" if budget is not None else "random"}
+        kwargs_opt.update(kwargs["opt"] if "opt" in kwargs else {})
+        budget_round = kwargs_opt.pop("budget", None)
+        if budget is not None and kwargs_opt["mode"] not in ["greedy", "milp"]:
+            print("Optimize.loop: Budget requires greedy or milp mode...")
+            return
+        cap = copy.deepcopy(capacity)
+        assign = mc.get_assignment()
+        if assign is None:
+            mc.set_assignment(Assignment(self._topo, list(cap.keys())))
+
+        # Run first simulation
+        traj = mc.run("", weeks, weeks_equi, capacity=cap, **kwargs_mc)
+        if traj is None:
+            mc.set_assignment(assign)
+            print("Optimize.loop: ERROR - Simulation failed...")
+            return
+        summary = [self._summary(traj)]
+
+        # Run rounds
+        for i in range(rounds):
+            # Check criteria
+            if all(summary[-1]["max"][fail] <= thresh for fail, thresh in crit.items()):
+                break
+
+            # Check budget
+            num_new = len([node for node in cap if node not in capacity])
+            if budget is not None and num_new >= budget:
+                break
+
+            # Optimize
+            budgets = [val for val in [budget_round, budget-num_new if budget is not None else None] if val is not None]
+            cap_new = self.run("", traj, budget=min(budgets) if budgets else None, **kwargs_opt)
+            if cap_new is None or cap_new==cap:
+                break
+            cap = cap_new
+
+            # Simulate continuing from previous occupancy
+            traj = mc.run("", weeks, weeks_warm, capacity=cap, occupancy=mc.get_occupancy(), **kwargs_mc)
+            if traj is None:
+                mc.set_assignment(assign)
+                print("Optimize.loop: ERROR - Simulation failed...")
+                return
+            summary.append(self._summary(traj))
+
+        # Restore assignment
+        mc.set_assignment(assign)
+
+        # Save results
+        results = {"cs": cap, "traj": traj, "summary": summary}
+        if file_out:
+            utils.save(results, file_out)
+
+        return results
+
+    def evaluate(self, file_out, mc, traj, num=4, weeks=1, weeks_equi=1, crit={"dist": 0.15, "occ": 0.15}, is_estimate=False, seed=None, processes=1, kwargs={"mc": {}, "opt": {}}):
+        """Generate alternative charging station layouts and rank them by
+        simulating each layout. Layouts are generated by repeating the
+        optimization in random mode, see :func:`run`, with duplicates removed.
+        Each layout is simulated with a short MC run using the same random
+        numbers, see :func:`simemobilecity.mc.MC.run_batch`, or with the
+        estimator, see :func:`simemobilecity.mc.MC.estimate`. Layouts are
+        evaluated in parallel processes sharing the prepared MC object and
+        topology. The layouts are ranked by the total fraction of failed
+        attempts.
+
+        Parameters
+        ----------
+        file_out : string
+            file link for output object file
+        mc : MC
+            MC object with users, pois and drivers set
+        traj : dictionary
+            Simulation trajectory of the mc code the layouts are generated from
+        num : integer, optional
+            Number of layouts to generate
+        weeks : integer, optional
+            Number of weeks to simulate each layout
+        weeks_equi : integer, optional
+            Number of weeks for equilibration of each layout
+        crit : dictionary, optional
+            Critical values of failures at which to optimize charging station capacities
+        is_estimate : bool, optional
+            True to evaluate layouts with the estimator instead of the MC code
+        seed : integer, optional
+            Random seed for generating and simulating layouts, leave empty for
+            a random state
+        processes : integer, optional
+            Number of parallel processes
+        kwargs : dictionary, optional
+            Dictionary with further parameters for the simulation **mc**, see
+            :func:`simemobilecity.mc.MC.run_batch`, and the optimization
+            **opt**, see :func:`run`, overriding the critical values for the
+            optimization
+
+        Returns
+        -------
+        layouts : list
+            List of dictionaries containing the capacities **cs**, the round
+            summary **summary**, see :func:`_summary`, and the failure fraction
+            **fail** for each layout, in ascending order of failures
+        """
+        # Initialize
+        kwargs_mc = kwargs["mc"] if "mc" in kwargs else {}
+        kwargs_opt = {"crit": crit}
+        kwargs_opt.update(kwargs["opt"] if "opt" in kwargs else {})
+        kwargs_opt["mode"] = "random"
+
+        # Generate layouts
+        capacities = []
+        for i in range(num):
+            if seed is not None:
+                random.seed(seed+i)
+            cap = self.run("", traj, **kwargs_opt)
+            if cap not in capacities:
+                capacities.append(cap)
+
+        # Evaluate layouts
+        trajs = mc.run_batch("", capacities, weeks, weeks_equi, seed=seed, processes=processes, is_estimate=is_estimate, **kwargs_mc)
+        if trajs is None:
+            return
+
+        # Rank layouts by failure fraction
+        layouts = []
+        for cap, traj_cap in zip(capacities, trajs):
+            summary = self._summary(traj_cap)
+            layouts.append({"cs": cap, "summary": summary, "fail": 1-summary["success"]})
+        layouts.sort(key=lambda x: x["fail"])
+
+        # Save layouts
+        if file_out:
+            utils.save(layouts, file_out)
+
+        return layouts
+
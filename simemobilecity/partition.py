@@ -5,20 +5,40 @@
 ################################################################################
 
 
+import os
+
+import numpy as np
 import pandas as pd
 
 
 class P:
-    """This class defines a probability object.
+    """This class defines a probability object. The probability is stored as
+    an array with a row for each weekday and a column for each hour.
 
     Parameters
     ----------
-    p : dictionary, float
+    p : dictionary, float, numpy.ndarray
         Probability each hour each weekday, either a float for the same
         probability each hour, dictionary of hours for same hour distribution
         for all days, a dictionary of days for the same hour probability for
-        different days, or a dictionary of days each with a dictionary of hours
+        different days, a dictionary of days each with a dictionary of hours,
+        or an array of days and hours
+
+    Examples
+    --------
+    Probability objects support arithmetic operations, returning new
+    probability objects
+
+    .. code-block:: python
+
+        import simemobilecity as sec
+
+        p = sec.P({hour: 0.1 if hour < 12 else 0.2 for hour in range(24)})
+        p = (p+sec.P(0.1))*0.5
+        p.normalize("day")
     """
+    __slots__ = ("_p",)
+
     def __init__(self, p):
         # Process input
         self.set_p(p)
@@ -35,35 +55,141 @@ class P:
         repr : String
             Pandas data frame of the probability
         """
-        return pd.DataFrame(self._p).to_string()
+        return pd.DataFrame(self._p.T if self._p is not None else None).to_string()
+
+
+    ##################
+    # Pickle Methods #
+    ##################
+    def __setstate__(self, state):
+        """Restore object state. Objects pickled before the attributes were
+        declared as slots store their attributes in a dictionary, with the
+        probability as a dictionary of days and hours, which are converted.
+
+        Parameters
+        ----------
+        state : dictionary, tuple
+            Object state, either a dictionary of attributes or a tuple of the
+            attribute dictionary and the slot dictionary
+        """
+        attrs = {}
+        for part in (state if isinstance(state, tuple) else (state,)):
+            attrs.update(part or {})
+        for name, val in attrs.items():
+            setattr(self, name, val)
+        if isinstance(self._p, dict):
+            self.set_p(self._p)
+
+
+    ##############
+    # Arithmetic #
+    ##############
+    def __add__(self, other):
+        """Add probability object, array or float.
+
+        Parameters
+        ----------
+        other : P, numpy.ndarray, float
+            Value to add
+
+        Returns
+        -------
+        p : P
+            New probability object
+        """
+        return P(self._p+(other.get_array() if isinstance(other, P) else other))
+
+    def __radd__(self, other):
+        """Add probability to an array or float, enables the use of sum.
+
+        Parameters
+        ----------
+        other : numpy.ndarray, float
+            Value to add
+
+        Returns
+        -------
+        p : P
+            New probability object
+        """
+        return self.__add__(other)
+
+    def __mul__(self, other):
+        """Scale probability with a float or array.
+
+        Parameters
+        ----------
+        other : numpy.ndarray, float
+            Scaling factor
+
+        Returns
+        -------
+        p : P
+            New probability object
+        """
+        return P(self._p*other)
+
+    def __rmul__(self, other):
+        """Scale probability with a float or array.
+
+        Parameters
+        ----------
+        other : numpy.ndarray, float
+            Scaling factor
+
+        Returns
+        -------
+        p : P
+            New probability object
+        """
+        return self.__mul__(other)
+
+
+    ##################
+    # Public Methods #
+    ##################
+    def normalize(self, p_norm):
+        """Normalize probability with its maximum value, see :func:`normalize`.
 
+        Parameters
+        ----------
+        p_norm: string
+            Normalization type **week**, **day** or **hour**
+        """
+        self._p = normalize(self._p[np.newaxis], p_norm)[0]
 
 
     ##################
     # Setter Methods #
     ##################
     def set_p(self, p):
-        """Set complete probability dictionary.
+        """Set complete probability.
 
         Parameters
         ----------
-        p : dictionary, float
+        p : dictionary, float, numpy.ndarray
             Probability each hour each weekday, either a float for the same
             probability each hour, dictionary of hours for same hour
             distribution for all days, a dictionary of days for the same hour
-            probability for different days, or a dictionary of days each with a
-            dictionary of hours
+            probability for different days, a dictionary of days each with a
+            dictionary of hours, or an array of days and hours
         """
-        if p:
+        if isinstance(p, np.ndarray):
+            if p.shape==(7, 24):
+                self._p = np.array(p, dtype=float)
+            else:
+                print("P: Invalid array shape...")
+                self._p = None
+        elif p:
             if isinstance(p, float) or isinstance(p, int):
-                self._p = {day: {hour: p for hour in range(24)} for day in range(7)}
+                self._p = np.full((7, 24), float(p))
             elif isinstance(p, dict):
                 if len(p.keys())==7 and 0 in p.keys() and isinstance(p[0], dict) and len(p[0].keys())==24:
-                    self._p = p
+                    self._p = np.array([[p[day][hour] for hour in range(24)] for day in range(7)], dtype=float)
                 elif 23 in p.keys():
-                    self._p = {day: {hour: p[hour] for hour in range(24)} for day in range(7)}
+                    self._p = np.tile([p[hour] for hour in range(24)], (7, 1)).astype(float)
                 elif 6 in p.keys():
-                    self._p = {day: {hour: p[day] for hour in range(24)} for day in range(7)}
+                    self._p = np.repeat([[p[day]] for day in range(7)], 24, axis=1).astype(float)
                 else:
                     print("P: Invalid dictionary input...")
                     self._p = None
@@ -85,7 +211,8 @@ class P:
         val : dictionary
             Probability dictionary for a day with each hour
         """
-        self._p[day] = val
+        for hour, p in val.items():
+            self._p[day, hour] = p
 
     def set_p_hour(self, day, hour, val):
         """Set probability for an hour.
@@ -99,7 +226,7 @@ class P:
         val : float
             Probability of selected hour
         """
-        self._p[day][hour] = val
+        self._p[day, hour] = val
 
 
     ##################
@@ -113,7 +240,7 @@ class P:
         val : dictionary
             Probability dictionary for each day and hour
         """
-        return self._p
+        return {day: self.get_p_day(day) for day in range(7)} if self._p is not None else None
 
     def get_p_day(self, day):
         """Return probability for a day.
@@ -128,7 +255,7 @@ class P:
         val : dictionary
             Probability dictionary for a day with each hour
         """
-        return self._p[day]
+        return dict(enumerate(self._p[day].tolist()))
 
     def get_p_hour(self, day, hour):
         """Return probability for an hour.
@@ -145,7 +272,71 @@ class P:
         val : float
             Probability of selected hour
         """
-        return self._p[day][hour]
+        return self._p[day, hour]
+
+    def get_array(self):
+        """Return probability array.
+
+        Returns
+        -------
+        val : numpy.ndarray
+            Probability array with a row for each day and a column for each
+            hour
+        """
+        return self._p
+
+
+def stack(ps):
+    """Stack probability objects into one array.
+
+    Parameters
+    ----------
+    ps : list
+        List of probability objects
+
+    Returns
+    -------
+    p : numpy.ndarray
+        Probability array of dimensions objects, days and hours
+    """
+    return np.stack([p.get_array() for p in ps]) if ps else np.zeros((0, 7, 24))
+
+
+def normalize(p, p_norm):
+    """Normalize stacked probabilities with the maximum value of all objects.
+    Entries with a maximum of zero are set to zero. Following normalization
+    types are available
+
+    * **week** - Normalize with the maximum value of the week
+    * **day** - Normalize each day with the maximum value of the day
+    * **hour** - Normalize each hour with the maximum value of the hour
+
+    Parameters
+    ----------
+    p : numpy.ndarray
+        Probability array of dimensions objects, days and hours
+    p_norm : string
+        Normalization type
+
+    Returns
+    -------
+    p : numpy.ndarray
+        Normalized probability array
+    """
+    # Determine maximum
+    if p_norm=="week":
+        max_p = p.max(initial=0)
+    elif p_norm=="day":
+        max_p = p.max(axis=(0, 2), initial=0)[:, np.newaxis]
+    elif p_norm=="hour":
+        max_p = p.max(axis=0, initial=0)
+    else:
+        print("P: Invalid normalization type...")
+        return p
+
+    # Normalize
+    max_p = np.broadcast_to(max_p, p.shape[1:])
+    return np.divide(p, max_p, out=np.zeros(p.shape), where=max_p>0)
 
 
 class T:
@@ -169,8 +360,34 @@ class T:
         distance **dist**
     node_keys : dictionary, optional
         Dictionary containing the relation of list and osmx ids
+    link : string, optional
+        File link for storing the trajectory in a memory-mapped numpy file,
+        leave empty to keep the trajectory in memory, stored as absolute path
+    dtype : type, optional
+        Data type of the values, integer for counts, float for accumulated
+        distances or expected values
+
+    Examples
+    --------
+    Trajectories with a file link are written directly into the memory-mapped
+    file. Once pickled, only the file link is stored, so that loading the
+    object opens the file read-only without copying the data. Multiple
+    processes loading the same object share the same pages
+
+    .. code-block:: python
+
+        import simemobilecity as sec
+
+        # Create trajectory on disk
+        t = sec.T(1000, 2, link="output/nodes.npy")
+        t.add_success(0, 8, 5, 1)
+        sec.utils.save(t, "output/nodes.obj")
+
+        # Open read-only
+        t = sec.utils.load("output/nodes.obj")
+        extract = t.extract([0], [7, 8, 9], [0, 1])
     """
-    def __init__(self, num_nodes, num_users, num_days=7, num_hours=24, failures=["occ", "dist"], node_keys={}):
+    def __init__(self, num_nodes, num_users, num_days=7, num_hours=24, failures=["occ", "dist"], node_keys={}, link="", dtype=float):
         # Initialize
         self._num_days = num_days
         self._num_hours = num_hours
@@ -178,23 +395,83 @@ class T:
         self._num_users = num_users
         self._failures = failures
         self._node_keys = node_keys
+        self._link = os.path.abspath(link) if link else ""
+        self._dtype = dtype
+        self._cube = None
+        self._stats = None
 
         # Generate data structure
-        self._t = []
-        for day in range(num_days):
-            for hour in range(num_hours):
-                for node in range(num_nodes):
-                    # Success
-                    for u_id in range(num_users):
-                        self._t.append(0)
-                    # Failure
-                    for fail in failures:
-                        for u_id in range(num_users):
-                            self._t.append(0)
+        size = num_days*num_hours*num_nodes*(len(failures)+1)*num_users
+        if link:
+            self._t = np.lib.format.open_memmap(self._link, mode="w+", dtype=dtype, shape=(size,))
+        else:
+            self._t = np.zeros(size, dtype=dtype)
+
+
+    ##################
+    # Pickle Methods #
+    ##################
+    def __getstate__(self):
+        """Remove memory-mapped data from the pickled state, since it is
+        already stored in the file link, including the statistics
+        accumulators.
+
+        Returns
+        -------
+        state : dictionary
+            Object state
+        """
+        state = self.__dict__.copy()
+        state["_cube"] = None
+        if self._link:
+            self.flush()
+            state["_t"] = None
+            if self._stats is not None:
+                state["_stats"] = dict(self._stats, prev=None, mean=None, m2=None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore object state. Memory-mapped trajectories and their
+        statistics accumulators are opened read-only and trajectories of older
+        versions stored as lists are converted to arrays.
+
+        Parameters
+        ----------
+        state : dictionary
+            Object state
+        """
+        self.__dict__.update(state)
+        self._link = state.get("_link", "")
+        self._dtype = state.get("_dtype", float)
+        self._cube = None
+        self._stats = state.get("_stats", None)
+        if self._link:
+            self._t = np.load(self._link, mmap_mode="r")
+            if self._stats is not None:
+                for name in ["prev", "mean", "m2"]:
+                    self._stats[name] = np.load(self._stats_link(name), mmap_mode="r")
+        elif isinstance(self._t, list):
+            self._t = np.array(self._t, dtype=float)
 
     ###################
     # Private Methods #
     ###################
+    def _stats_link(self, name):
+        """Get file link of a memory-mapped statistics accumulator, stored
+        next to the trajectory file.
+
+        Parameters
+        ----------
+        name : string
+            Accumulator name
+
+        Returns
+        -------
+        link : string
+            File link
+        """
+        return os.path.splitext(self._link)[0]+"_"+name+".npy"
+
     def _index(self, day, hour, node, user_id, fail=""):
         """Calculate list index for given settings.
 
@@ -223,10 +500,110 @@ class T:
 
         return index
 
+    def _view(self):
+        """Return trajectory as a multidimensional view without copying the
+        data. The dimensions are days, hours, nodes, success and failures, and
+        users.
+
+        Returns
+        -------
+        view : numpy.ndarray
+            Trajectory view
+        """
+        return self._t.reshape(self._num_days, self._num_hours, self._num_nodes, len(self._failures)+1, self._num_users)
+
+    def _build_cube(self):
+        """Build cumulative sum cube over the day and hour axes. The cube has
+        a leading row of zeros for both axes, so that the sum of a window is
+        the difference of the four corner values.
+
+        Returns
+        -------
+        cube : numpy.ndarray
+            Cumulative sum cube
+        """
+        if self._cube is None:
+            self._cube = np.zeros((self._num_days+1, self._num_hours+1, self._num_nodes, len(self._failures)+1, self._num_users))
+            self._cube[1:, 1:] = self._view().cumsum(axis=0).cumsum(axis=1)
+        return self._cube
+
+    def _add_hist(self, node, user_id, fail, dist):
+        """Add walking distance to the distance histogram.
+
+        Parameters
+        ----------
+        node : node
+            Node index
+        user_id : integer
+            User index
+        fail : string
+            Failure reason, leave empty for success
+        dist : float
+            Walking distance from node to charging station
+        """
+        node = self._node_keys[node] if self._node_keys else node
+        fail = self._failures.index(fail)+1 if fail else 0
+        self._stats["hist"][node, fail, user_id, np.searchsorted(self._stats["bins"], dist, side="right")] += 1
+
 
     ##################
     # Public Methods #
     ##################
+    def flush(self):
+        """Write changes of a memory-mapped trajectory to disk."""
+        if self._link and isinstance(self._t, np.memmap):
+            self._t.flush()
+            if self._stats is not None:
+                for name in ["prev", "mean", "m2"]:
+                    self._stats[name].flush()
+
+    def set_stats(self, bins=[]):
+        """Enable statistics mode. Hereby each call of :func:`fold` adds the
+        entries since the previous call as one sample to streaming mean and
+        variance accumulators for each entry, using the Welford algorithm.
+        Optionally, walking distances added to the trajectory are counted in
+        a histogram with fixed bins for each node, user type and success or
+        failure. For memory-mapped trajectories, the accumulators are
+        memory-mapped files next to the trajectory file.
+
+        Parameters
+        ----------
+        bins : list, optional
+            Ascending bin edges of the walking distance histogram in m, leave
+            empty to disable the histogram
+        """
+        self._stats = {"num": 0, "bins": None, "hist": None}
+        for name, dtype in [("prev", self._t.dtype), ("mean", float), ("m2", float)]:
+            if self._link:
+                self._stats[name] = np.lib.format.open_memmap(self._stats_link(name), mode="w+", dtype=dtype, shape=self._t.shape)
+            else:
+                self._stats[name] = np.zeros(self._t.size, dtype=dtype)
+        self._stats["prev"][:] = self._t
+        if len(bins):
+            self._stats["bins"] = np.asarray(bins, dtype=float)
+            self._stats["hist"] = np.zeros((self._num_nodes, len(self._failures)+1, self._num_users, len(bins)+1), dtype=int)
+
+    def fold(self):
+        """Add entries since the previous call as one sample to the statistics,
+        for example one simulated week. Entries are processed in chunks, so
+        that no temporary arrays of the full trajectory size are created.
+        """
+        # Check statistics mode
+        if self._stats is None:
+            print("T.fold: Statistics mode is not enabled...")
+            return
+
+        # Update mean and variance
+        self._stats["num"] += 1
+        prev, mean, m2 = self._stats["prev"], self._stats["mean"], self._stats["m2"]
+        for start in range(0, self._t.size, 2**20):
+            chunk = slice(start, start+2**20)
+            sample = self._t[chunk]-prev[chunk]
+            delta = sample-mean[chunk]
+            mean[chunk] += delta/self._stats["num"]
+            m2[chunk] += delta*(sample-mean[chunk])
+            prev[chunk] = self._t[chunk]
+
     def add_success(self, day, hour, node, user_id):
         """Add a successfull charging instance to given day, hour, node, and
         user_id.
@@ -243,6 +620,7 @@ class T:
             User index
         """
         self._t[self._index(day, hour, node, user_id)] += 1
+        self._cube = None
 
     def add_success_dist(self, day, hour, node, user_id, dist):
         """Add walking distance of a successfull charging instance to given day,
@@ -262,6 +640,25 @@ class T:
             Walking distance from node to charging station
         """
         self._t[self._index(day, hour, node, user_id)] += dist
+        self._cube = None
+        if self._stats is not None and self._stats["bins"] is not None:
+            self._add_hist(node, user_id, "", dist)
+
+    def add_hour(self, day, hour, val):
+        """Add values for all nodes and user types of a given day and hour.
+
+        Parameters
+        ----------
+        day : integer
+            Day index
+        hour : integer
+            Hour index
+        val : numpy.ndarray
+            Array of dimensions nodes, success and failures, and users, with
+            nodes in order of the list index
+        """
+        self._view()[day, hour] += val
+        self._cube = None
 
     def add_fail(self, day, hour, node, user_id, fail):
         """Add a failed charging instance to given day, hour, node, and user type
@@ -281,6 +678,7 @@ class T:
             Failure reason
         """
         self._t[self._index(day, hour, node, user_id, fail)] += 1
+        self._cube = None
 
     def add_fail_dist(self, day, hour, node, user_id, dist):
         """Add a failed charging instance to given day, hour, node, and user type
@@ -300,13 +698,36 @@ class T:
             Walking distance from node to charging station
         """
         self._t[self._index(day, hour, node, user_id, "dist")] += dist
+        self._cube = None
+        if self._stats is not None and self._stats["bins"] is not None:
+            self._add_hist(node, user_id, "dist", dist)
+
+    def merge(self, traj, nodes):
+        """Add trajectory of a subset of nodes, for example of a shard of the
+        city. Statistics are not merged.
+
+        Parameters
+        ----------
+        traj : T
+            Trajectory with the same days, hours, failures and users
+        nodes : list
+            List of node indices of the given trajectory nodes in this
+            trajectory
+        """
+        self._view()[:, :, nodes] += traj._view()
+        self._cube = None
 
-    def extract(self, days, hours, users, is_norm=True):
+    def extract(self, days, hours, users, is_norm=True, is_ci=False, z=1.96):
         """Extract data from trajectory for the given days hours and user types.
         The data for the different values will be combined to one node list with
         percentages for success and failure. The latter will be divided into the
         different failure types.
 
+        In statistics mode, confidence intervals can be added as entry **ci**
+        of each node, containing the half width of the interval for the success
+        and failure values. The interval is determined from the sample variance
+        of the folded samples, assuming the combined entries are independent.
+
         Parameters
         ----------
         days : list
@@ -317,6 +738,11 @@ class T:
             List of user ids to combine
         is_norm : bool
             True to noromalize results
+        is_ci : bool, optional
+            True to add confidence intervals in statistics mode
+        z : float, optional
+            Quantile of the standard normal distribution for the confidence
+            level - default is a 95% interval
 
         Returns
         -------
@@ -326,34 +752,140 @@ class T:
         # Initialize
         nodes = {}
         node_ids = self._node_keys.keys() if self._node_keys else range(self._num_nodes)
+        node_index = [self._node_keys[node] for node in node_ids] if self._node_keys else list(node_ids)
+
+        # Process confidence intervals
+        if is_ci and self._stats is None:
+            print("T.extract: Statistics mode is not enabled, confidence intervals are ignored...")
+            is_ci = False
+
+        # Sum up blocks of given days and hours - only touch the needed pages
+        view = self._view()
+        data = np.zeros((self._num_nodes, len(self._failures)+1))
+        for day in days:
+            for hour in hours:
+                data += view[day, hour][:, :, users].sum(axis=2)
+
+        # Sum up variances and convert to interval of the total over all samples
+        if is_ci:
+            num = self._stats["num"]
+            var = self._stats["m2"].reshape(view.shape)
+            ci = np.zeros((self._num_nodes, len(self._failures)+1))
+            for day in days:
+                for hour in hours:
+                    ci += var[day, hour][:, :, users].sum(axis=2)
+            ci = z*np.sqrt(num*ci/(num-1)) if num > 1 else ci
 
         # Run through nodes
-        for node in node_ids:
+        for node, index in zip(node_ids, node_index):
             # Build structure
-            nodes[node] = {"success": 0, "fail": {fail: 0 for fail in self._failures}}
-
-            # Extract values
-            for day in days:
-                for hour in hours:
-                    for user in users:
-                        nodes[node]["success"] += self.get_success(day, hour, node, user)
-                        for fail in self._failures:
-                            nodes[node]["fail"][fail] += self.get_fail(day, hour, node, user, fail)
+            nodes[node] = {"success": float(data[index, 0]), "fail": {fail: float(data[index, i+1]) for i, fail in enumerate(self._failures)}}
+            if is_ci:
+                nodes[node]["ci"] = {"success": float(ci[index, 0]), "fail": {fail: float(ci[index, i+1]) for i, fail in enumerate(self._failures)}}
 
             # Calculate percentages
             if is_norm:
-                normalize = nodes[node]["success"]+sum([nodes[node]["fail"][fail] for fail in self._failures])
+                normalize = float(data[index].sum())
                 nodes[node]["success"] = nodes[node]["success"]/normalize if normalize else 0
                 for fail in self._failures:
                     nodes[node]["fail"][fail] = nodes[node]["fail"][fail]/normalize if normalize else 0
+                if is_ci:
+                    nodes[node]["ci"]["success"] = nodes[node]["ci"]["success"]/normalize if normalize else 0
+                    for fail in self._failures:
+                        nodes[node]["ci"]["fail"][fail] = nodes[node]["ci"]["fail"][fail]/normalize if normalize else 0
 
         # Return nodes
         return nodes
 
+    def query(self, days, hours, node, user_id):
+        """Return the sum over a rectangular day and hour window for a node and
+        user type. The cumulative sum cube is built on the first query and
+        rebuilt after the trajectory is changed, so that each query is
+        answered in constant time.
+
+        Parameters
+        ----------
+        days : list
+            Start and end day id of the window, end is excluded
+        hours : list
+            Start and end hour id of the window, end is excluded
+        node : node
+            Node index
+        user_id : integer
+            User index
+
+        Returns
+        -------
+        val : numpy.ndarray
+            Summed success and failures in order of the failure list
+        """
+        return self.query_batch([days], [hours], [node], [user_id])[0]
+
+    def query_batch(self, days, hours, nodes, users):
+        """Return sums over multiple rectangular day and hour windows. Each
+        window is defined by a row of the given lists.
+
+        Parameters
+        ----------
+        days : list
+            Start and end day ids of the windows, end is excluded
+        hours : list
+            Start and end hour ids of the windows, end is excluded
+        nodes : list
+            Node indices of the windows
+        users : list
+            User indices of the windows
+
+        Returns
+        -------
+        val : numpy.ndarray
+            Array with one row for each window containing summed success and
+            failures in order of the failure list
+        """
+        # Initialize
+        cube = self._build_cube()
+        days = np.asarray(days, dtype=int).reshape(-1, 2)
+        hours = np.asarray(hours, dtype=int).reshape(-1, 2)
+        nodes = np.array([self._node_keys[node] for node in nodes] if self._node_keys else nodes, dtype=int)
+        users = np.asarray(users, dtype=int)
+
+        # Combine corners of the windows
+        val = cube[days[:, 1], hours[:, 1], nodes, :, users]
+        val -= cube[days[:, 0], hours[:, 1], nodes, :, users]
+        val -= cube[days[:, 1], hours[:, 0], nodes, :, users]
+        val += cube[days[:, 0], hours[:, 0], nodes, :, users]
+
+        return val
+
 
     ##################
     # Setter Methods #
     ##################
+    def set_frame(self, frame):
+        """Set trajectory values from a data frame in the long format created
+        by :func:`get_frame`. Cells not contained in the data frame are not
+        changed.
+
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            Data frame with columns **day**, **hour**, **node**, **user**,
+            **success** and a column for each failure named
+            **fail_** *failure*
+        """
+        # Process node ids
+        nodes = frame["node"].map(self._node_keys).to_numpy() if self._node_keys else frame["node"].to_numpy()
+        index = (frame["day"].to_numpy(dtype=int), frame["hour"].to_numpy(dtype=int), nodes.astype(int))
+        users = frame["user"].to_numpy(dtype=int)
+
+        # Set values
+        view = self._view()
+        view[index[0], index[1], index[2], 0, users] = frame["success"].to_numpy()
+        for i, fail in enumerate(self._failures):
+            if "fail_"+fail in frame.columns:
+                view[index[0], index[1], index[2], i+1, users] = frame["fail_"+fail].to_numpy()
+        self._cube = None
+
     def set_success(self, day, hour, node, user_id, val):
         """Set sucess value for given day, hour, node, and user type.
 
@@ -371,6 +903,7 @@ class T:
             New entry value
         """
         self._t[self._index(day, hour, node, user_id)] = val
+        self._cube = None
 
     def set_fail(self, day, hour, node, user_id, fail, val):
         """Set failure value for given day, hour, node, and user type with
@@ -392,11 +925,53 @@ class T:
             New entry value
         """
         self._t[self._index(day, hour, node, user_id, fail)] = val
+        self._cube = None
 
 
     ##################
     # Getter Methods #
     ##################
+    def get_frame(self, days=[], is_zero=False):
+        """Get trajectory as a data frame in long format with one row for each
+        day, hour, node, and user type. Columns are **day**, **hour**,
+        **node**, **user**, **success** and a column for each failure named
+        **fail_** *failure*.
+
+        Parameters
+        ----------
+        days : list, optional
+            List of day ids to convert, leave empty for all days
+        is_zero : bool, optional
+            True to keep rows without any entry
+
+        Returns
+        -------
+        frame : pandas.DataFrame
+            Trajectory data frame
+        """
+        # Initialize
+        days = days if days else range(self._num_days)
+        node_ids = np.array(list(self._node_keys.keys()) if self._node_keys else range(self._num_nodes), dtype=np.int64)
+        node_index = [self._node_keys[node] for node in node_ids] if self._node_keys else node_ids
+        hours, nodes, users = [x.ravel() for x in np.meshgrid(range(self._num_hours), node_ids, range(self._num_users), indexing="ij")]
+
+        # Run through days
+        view = self._view()
+        frames = []
+        for day in days:
+            # Order data as hours, nodes, users, success and failures
+            data = view[day][:, node_index].transpose(0, 1, 3, 2).reshape(-1, len(self._failures)+1)
+
+            # Create data frame
+            frame = {"day": np.full(data.shape[0], day), "hour": hours, "node": nodes, "user": users, "success": data[:, 0]}
+            frame.update({"fail_"+fail: data[:, i+1] for i, fail in enumerate(self._failures)})
+            frame = pd.DataFrame(frame)
+
+            # Remove empty rows
+            frames.append(frame if is_zero else frame[data.any(axis=1)])
+
+        return pd.concat(frames, ignore_index=True)
+
     def get_success(self, day, hour, node, user_id):
         """Get sucess value for given day, hour, node, and user type.
 
@@ -492,3 +1067,115 @@ class T:
             Node keys dictionary for mapping osmnx index to list index
         """
         return self._node_keys
+
+    def get_mean(self, day, hour, node, user_id, fail=""):
+        """Get mean value of the folded samples in statistics mode for given
+        day, hour, node, and user type.
+
+        Parameters
+        ----------
+        day : integer
+            Day index
+        hour : integer
+            Hour index
+        node : node
+            Node index
+        user_id : integer
+            User index
+        fail : string, optional
+            Failure reason, leave empty for success
+
+        Returns
+        -------
+        val : float
+            Sample mean
+        """
+        return self._stats["mean"][self._index(day, hour, node, user_id, fail)]
+
+    def get_var(self, day, hour, node, user_id, fail=""):
+        """Get sample variance of the folded samples in statistics mode for
+        given day, hour, node, and user type.
+
+        Parameters
+        ----------
+        day : integer
+            Day index
+        hour : integer
+            Hour index
+        node : node
+            Node index
+        user_id : integer
+            User index
+        fail : string, optional
+            Failure reason, leave empty for success
+
+        Returns
+        -------
+        val : float
+            Sample variance
+        """
+        num = self._stats["num"]
+        return self._stats["m2"][self._index(day, hour, node, user_id, fail)]/(num-1) if num > 1 else 0
+
+    def get_num_samples(self):
+        """Get number of folded samples in statistics mode.
+
+        Returns
+        -------
+        val : integer
+            Number of samples
+        """
+        return self._stats["num"] if self._stats is not None else 0
+
+    def get_hist(self, node, user_id, fail=""):
+        """Get walking distance histogram in statistics mode for given node and
+        user type. The first and last bins count distances below and above the
+        given bin edges.
+
+        Parameters
+        ----------
+        node : node
+            Node index
+        user_id : integer
+            User index
+        fail : string, optional
+            Failure reason, leave empty for success
+
+        Returns
+        -------
+        val : numpy.ndarray
+            Histogram counts
+        """
+        node = self._node_keys[node] if self._node_keys else node
+        fail = self._failures.index(fail)+1 if fail else 0
+        return self._stats["hist"][node, fail, user_id]
+
+    def get_failures(self):
+        """Get failure types.
+
+        Returns
+        -------
+        val : list
+            List of failure types
+        """
+        return self._failures
+
+    def get_array(self):
+        """Get trajectory array.
+
+        Returns
+        -------
+        array : numpy.ndarray
+            Array of days, hours, nodes, success and failures, and users
+        """
+        return self._view()
+
+    def get_link(self):
+        """Get file link of memory-mapped trajectory.
+
+        Returns
+        -------
+        val : string
+            File link, empty if trajectory is kept in memory
+        """
+        return self._link
@@ -27,6 +27,8 @@ class Poi(P):
     max_dist : float, optional
         Maximal allowed distance from charging station poi in m
     """
+    __slots__ = ("_topo", "_tags", "_max_dist", "_G", "_nodes")
+
     def __init__(self, topo, tags, p, radius=200, max_dist=500):
         # Call super class
         super(Poi, self).__init__(p)
@@ -0,0 +1,114 @@
+################################################################################
+# Queueing                                                                     #
+#                                                                              #
+"""Analytic queueing models for charging station occupancy."""
+################################################################################
+
+
+import numpy as np
+
+
+def erlang_b(capacity, load):
+    """Calculate the Erlang-B blocking probability, which is the probability
+    of all charging points of a station being occupied, for given capacities
+    and offered loads. The offered load is the expected number of occupied
+    charging points without a capacity limit. The calculation is vectorized
+    over all stations using the recursion
+
+    .. math::
+
+        B(0, A) = 1, \\quad B(c, A) = \\frac{A B(c-1, A)}{c + A B(c-1, A)}
+
+    Parameters
+    ----------
+    capacity : numpy.ndarray, integer
+        Number of charging points of each station
+    load : numpy.ndarray, float
+        Offered load of each station
+
+    Returns
+    -------
+    block : numpy.ndarray
+        Blocking probability of each station
+    """
+    # Initialize
+    capacity, load = np.broadcast_arrays(np.asarray(capacity, dtype=int), np.asarray(load, dtype=float))
+    block = np.ones(load.shape)
+    b = np.ones(load.shape)
+
+    # Run recursion up to maximal capacity
+    for c in range(1, int(capacity.max(initial=0))+1):
+        b = load*b/(c+load*b)
+        block[capacity==c] = b[capacity==c]
+
+    return block
+
+
+def erlang_b_load(capacity, block, iterations=60):
+    """Calculate the offered load resulting in the given Erlang-B blocking
+    probability, see :func:`erlang_b`, by bisection vectorized over all
+    stations. Since the carried load can not exceed the capacity, the offered
+    load is bounded by :math:`c/(1-B)`.
+
+    Parameters
+    ----------
+    capacity : numpy.ndarray, integer
+        Number of charging points of each station
+    block : numpy.ndarray, float
+        Blocking probability of each station, smaller than one
+    iterations : integer, optional
+        Number of bisection steps
+
+    Returns
+    -------
+    load : numpy.ndarray
+        Offered load of each station
+    """
+    # Initialize
+    capacity, block = np.broadcast_arrays(np.asarray(capacity, dtype=int), np.asarray(block, dtype=float))
+    lower = np.zeros(block.shape)
+    upper = capacity/(1-block)
+
+    # Run bisection
+    for i in range(iterations):
+        load = (lower+upper)/2
+        is_high = erlang_b(capacity, load) > block
+        upper = np.where(is_high, load, upper)
+        lower = np.where(is_high, lower, load)
+
+    return (lower+upper)/2
+
+
+def erlang_b_capacity(load, block):
+    """Calculate the smallest capacity with an Erlang-B blocking probability
+    not exceeding the given target for given offered loads, see
+    :func:`erlang_b`. The recursion is run over increasing capacities until
+    the target is met for all stations.
+
+    Parameters
+    ----------
+    load : numpy.ndarray, float
+        Offered load of each station
+    block : numpy.ndarray, float
+        Target blocking probability of each station, larger than zero
+
+    Returns
+    -------
+    capacity : numpy.ndarray
+        Smallest number of charging points of each station
+    """
+    # Initialize
+    load, block = np.broadcast_arrays(np.asarray(load, dtype=float), np.asarray(block, dtype=float))
+    capacity = np.zeros(load.shape, dtype=int)
+    b = np.ones(load.shape)
+    is_open = b > block
+
+    # Run recursion until target is met
+    c = 0
+    while is_open.any():
+        c += 1
+        b = load*b/(c+load*b)
+        capacity[is_open] = c
+        is_open &= b > block
+
+    return capacity
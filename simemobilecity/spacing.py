@@ -0,0 +1,148 @@
+################################################################################
+# Spacing Class                                                                #
+#                                                                              #
+"""Minimal spacing check between charging stations."""
+################################################################################
+
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+
+class Spacing:
+    """This class checks whether nodes keep a minimal distance to all
+    charging stations, based on the coordinates of the projected topology
+    graph. Station coordinates are stored in a KD-tree. Added stations are
+    collected in a small buffer that is searched directly, and the tree is
+    rebuilt once the buffer is full, so that stations can be added
+    incrementally without rebuilding the tree each time.
+
+    Parameters
+    ----------
+    topo : Topology
+        Topology object
+    stations : list, optional
+        List of charging station nodes
+    min_dist : float, optional
+        Minimal distance in m between charging stations
+    buffer_size : integer, optional
+        Number of added stations collected before rebuilding the tree
+
+    Examples
+    --------
+    Following example checks a node for the spacing to all charging stations
+
+    .. code-block:: python
+
+        import simemobilecity as sec
+
+        spacing = sec.Spacing(topo, list(capacity.keys()), min_dist=150)
+        if spacing.is_free(node):
+            spacing.add(node)
+    """
+    def __init__(self, topo, stations=[], min_dist=150, buffer_size=64):
+        # Initialize
+        self._min_dist = min_dist
+        self._buffer_size = buffer_size
+        self._pos = {node: (data["x"], data["y"]) for node, data in topo.get_Gp().nodes(data=True)}
+        self._stations = dict.fromkeys(stations)
+
+        # Build tree
+        self._build()
+
+
+    ###################
+    # Private Methods #
+    ###################
+    def _build(self):
+        """Build KD-tree from all station coordinates and empty the buffer."""
+        self._tree = cKDTree(np.array([self._pos[station] for station in self._stations]).reshape(-1, 2))
+        self._buffer = []
+
+
+    ##################
+    # Public Methods #
+    ##################
+    def add(self, station):
+        """Add a charging station.
+
+        Parameters
+        ----------
+        station : integer
+            Charging station node
+        """
+        if station in self._stations:
+            return
+        self._stations[station] = None
+        self._buffer.append(self._pos[station])
+        if len(self._buffer) >= self._buffer_size:
+            self._build()
+
+    def filter(self, nodes):
+        """Get nodes keeping the minimal distance to all charging stations.
+
+        Parameters
+        ----------
+        nodes : list
+            List of nodes
+
+        Returns
+        -------
+        nodes : list
+            List of nodes with no charging station within the minimal distance
+        """
+        # Initialize
+        if not nodes:
+            return []
+        pos = np.array([self._pos[node] for node in nodes])
+
+        # Search tree
+        dist, _ = self._tree.query(pos, distance_upper_bound=self._min_dist) if self._tree.n else (np.full(len(nodes), np.inf), None)
+        is_free = dist > self._min_dist
+
+        # Search buffer
+        if self._buffer:
+            buffer = np.array(self._buffer)
+            is_free &= (((pos[:, np.newaxis, :]-buffer[np.newaxis, :, :])**2).sum(axis=2) > self._min_dist**2).all(axis=1)
+
+        return [node for node, free in zip(nodes, is_free) if free]
+
+    def is_free(self, node):
+        """Check if a node keeps the minimal distance to all charging stations.
+
+        Parameters
+        ----------
+        node : integer
+            Node
+
+        Returns
+        -------
+        is_free : bool
+            True if no charging station is within the minimal distance
+        """
+        return bool(self.filter([node]))
+
+
+    ##################
+    # Getter Methods #
+    ##################
+    def get_stations(self):
+        """Get charging stations.
+
+        Returns
+        -------
+        stations : list
+            List of charging station nodes
+        """
+        return list(self._stations)
+
+    def get_min_dist(self):
+        """Get minimal distance between charging stations.
+
+        Returns
+        -------
+        min_dist : float
+            Minimal distance in m
+        """
+        return self._min_dist
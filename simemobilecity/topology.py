@@ -5,12 +5,22 @@
 ################################################################################
 
 
+import sys
 import math
+import hashlib
+import numpy as np
 import osmnx as ox
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 
+import simemobilecity.utils as utils
+
+from collections import OrderedDict
+from scipy.sparse import csr_matrix
+from scipy.cluster.vq import kmeans2
+from scipy.sparse.csgraph import dijkstra
+
 
 class Topology:
     """This class is a python wrapper for the osmnx package. The input is a
@@ -33,6 +43,76 @@ class Topology:
         self._G = ox.graph_from_place(loc["name"], network_type="walk") if not "G" in loc.keys() else loc["G"]
         self._Gp = ox.project_graph(self._G) if not "Gp" in loc.keys() else loc["Gp"]
         self._nodes = list(self._G)
+        self._matrix = None
+        self._keys = None
+        self._fingerprint = None
+        self._cache = None
+        self._cells = None
+
+    def _sssp(self, node, cutoff=None):
+        """Calculate distances from a node to all nodes within a cutoff. If
+        the cache is enabled, see :func:`set_cache`, distances are served from
+        a cached search of the node with the same or a larger cutoff. Otherwise
+        the search result is cached, replacing searches of the node with a
+        smaller cutoff and removing least recently used searches exceeding the
+        cache limits.
+
+        Parameters
+        ----------
+        node : integer
+            Node of origin
+        cutoff : float, optional
+            Maximal distance in m, leave empty for no limit
+
+        Returns
+        -------
+        dists : dictionary
+            Dictionary of reached nodes and distances in m in order of distance,
+            may contain further nodes beyond the cutoff if served from cache
+        """
+        # Load from cache
+        if self._cache is not None:
+            if node in self._cache["data"]:
+                cutoff_cached, dists, size = self._cache["data"][node]
+                if cutoff_cached is None or (cutoff is not None and cutoff <= cutoff_cached):
+                    self._cache["data"].move_to_end(node)
+                    self._cache["hits"] += 1
+                    return dists
+                self._cache["bytes"] -= size
+                del self._cache["data"][node]
+            self._cache["misses"] += 1
+
+        # Run search
+        dists = nx.single_source_dijkstra_path_length(self._G, node, cutoff=cutoff, weight="length")
+
+        # Add to cache and remove least recently used searches
+        if self._cache is not None:
+            size = sys.getsizeof(dists)+24*len(dists)
+            self._cache["data"][node] = (cutoff, dists, size)
+            self._cache["bytes"] += size
+            while self._cache["data"] and ((self._cache["max_entries"] is not None and len(self._cache["data"]) > self._cache["max_entries"]) or
+                                           (self._cache["max_bytes"] is not None and self._cache["bytes"] > self._cache["max_bytes"])):
+                self._cache["bytes"] -= self._cache["data"].popitem(last=False)[1][2]
+
+        return dists
+
+    def set_cache(self, max_entries=None, max_bytes=None, is_cache=True):
+        """Enable cache of single source searches for distance, radius and ring
+        queries. Queries from the same node with any destination, or with the
+        same or a smaller radius, are served from the cache. Enabling the
+        cache empties it.
+
+        Parameters
+        ----------
+        max_entries : integer, optional
+            Maximal number of cached searches, leave empty for no limit
+        max_bytes : integer, optional
+            Maximal estimated size of cached searches in bytes, leave empty for
+            no limit
+        is_cache : bool, optional
+            False to disable the cache
+        """
+        self._cache = {"data": OrderedDict(), "bytes": 0, "hits": 0, "misses": 0, "max_entries": max_entries, "max_bytes": max_bytes} if is_cache else None
 
     def dist(self, orig, dest, is_route=False):
         """Calculate the distance between two locations
@@ -54,7 +134,13 @@ class Topology:
             Route as list of nodes
         """
         # Calculate shortest distance
-        route_len = nx.shortest_path_length(self._G, orig, dest, weight="length")
+        if self._cache is not None:
+            dists = self._sssp(orig)
+            if dest not in dists:
+                raise nx.NetworkXNoPath("No path to "+str(dest)+".")
+            route_len = dists[dest]
+        else:
+            route_len = nx.shortest_path_length(self._G, orig, dest, weight="length")
 
         # Get shortest route
         if is_route:
@@ -190,10 +276,442 @@ class Topology:
             List of nodes within radius
         """
         # Search for nodes
+        if self._cache is not None:
+            return [x for x, dist in self._sssp(node, radius).items() if dist <= radius]
         nodes = nx.ego_graph(self._G, node, radius, distance="length")
 
         return list(nodes)
 
+    def _get_matrix(self):
+        """Create sparse distance matrix of the graph with the shortest of
+        parallel edges once, indexed in order of the graph nodes.
+
+        Returns
+        -------
+        keys : dictionary
+            Dictionary of nodes and matrix indices
+        """
+        if self._matrix is None:
+            self._keys = {x: i for i, x in enumerate(self._nodes)}
+            edges = np.array([(self._keys[u], self._keys[v], length) for u, v, length in self._G.edges(data="length", default=1)], dtype=float).reshape(-1, 3)
+            edges = edges[np.lexsort((edges[:, 2], edges[:, 1], edges[:, 0]))]
+            is_first = np.ones(edges.shape[0], dtype=bool)
+            is_first[1:] = (edges[1:, 0]!=edges[:-1, 0]) | (edges[1:, 1]!=edges[:-1, 1])
+            edges = edges[is_first]
+            self._matrix = csr_matrix((edges[:, 2], (edges[:, 0].astype(int), edges[:, 1].astype(int))), shape=(len(self._nodes), len(self._nodes)))
+        return self._keys
+
+    def _dists(self, orig_ids, dest_ids, is_route):
+        """Calculate distances and routes from multiple origins on the sparse
+        distance matrix, see :func:`dists`.
+
+        Parameters
+        ----------
+        orig_ids : list
+            List of origin matrix indices
+        dest_ids : list
+            List of destination matrix index lists for each origin
+        is_route : bool
+            True to return routes
+
+        Returns
+        -------
+        results : list
+            List of distance arrays and route lists for each origin, routes
+            are None if not requested
+        """
+        # Run searches
+        if is_route:
+            dist, pred = dijkstra(self._matrix, indices=orig_ids, return_predecessors=True)
+        else:
+            dist = dijkstra(self._matrix, indices=orig_ids)
+
+        # Collect destinations
+        results = []
+        for i, ids in enumerate(dest_ids):
+            routes = None
+            if is_route:
+                routes = []
+                for dest in ids:
+                    route = None
+                    if np.isfinite(dist[i, dest]):
+                        route = [dest]
+                        while route[-1]!=orig_ids[i]:
+                            route.append(pred[i, route[-1]])
+                        route = [self._nodes[x] for x in reversed(route)]
+                    routes.append(route)
+            results.append((dist[i, ids], routes))
+
+        return results
+
+    def dists(self, origs, dests, is_pair=False, is_route=False, processes=1, chunk=64):
+        """Calculate distances between multiple origins and destinations.
+        Origins are grouped, so that a single search is run from each distinct
+        origin, with the searches running in chunks on the sparse distance
+        matrix of the graph. Routes are reconstructed from the predecessors of
+        the same search. Chunks can be processed in parallel processes sharing
+        the distance matrix.
+
+        Parameters
+        ----------
+        origs : list
+            List of nodes of origin
+        dests : list
+            List of nodes of destination
+        is_pair : bool, optional
+            True to calculate the distance for each pair of origin and
+            destination of same index, otherwise the distance between all
+            origins and destinations is calculated
+        is_route : bool, optional
+            True to return routes
+        processes : integer, optional
+            Number of parallel processes
+        chunk : integer, optional
+            Number of origins searched at once
+
+        Returns
+        -------
+        dists : numpy.ndarray
+            Route lengths in m, either a vector of pairs or a matrix of origins
+            and destinations, infinite for unreachable destinations
+        routes : list, optional
+            Routes as list of nodes in the shape of the distances, None for
+            unreachable destinations
+        """
+        # Process input
+        if is_pair and not len(origs)==len(dests):
+            print("Topology.dists: Number of origins and destinations must be equal for pairs...")
+            return
+
+        # Group destinations by origin
+        keys = self._get_matrix()
+        groups = {}
+        if is_pair:
+            for i, (orig, dest) in enumerate(zip(origs, dests)):
+                groups.setdefault(keys[orig], []).append((i, keys[dest]))
+        else:
+            dest_ids = [keys[dest] for dest in dests]
+            for orig in origs:
+                groups.setdefault(keys[orig], None)
+        orig_ids = list(groups.keys())
+        tasks = [{"orig_ids": orig_ids[start:start+chunk],
+                  "dest_ids": [[dest for i, dest in groups[orig]] if is_pair else dest_ids for orig in orig_ids[start:start+chunk]],
+                  "is_route": is_route} for start in range(0, len(orig_ids), chunk)]
+
+        # Run searches
+        if processes > 1:
+            results = sum(utils.parallel(_dists_task, self, tasks, processes), [])
+        else:
+            results = sum([_dists_task(self, task) for task in tasks], [])
+        results = dict(zip(orig_ids, results))
+
+        # Assemble output
+        if is_pair:
+            dists = np.zeros(len(origs))
+            routes = [None for i in range(len(origs))]
+            for orig, group in groups.items():
+                for j, (i, dest) in enumerate(group):
+                    dists[i] = results[orig][0][j]
+                    if is_route:
+                        routes[i] = results[orig][1][j]
+        else:
+            dists = np.zeros((len(origs), len(dests)))
+            routes = []
+            for i, orig in enumerate(origs):
+                dists[i] = results[keys[orig]][0]
+                if is_route:
+                    routes.append(results[keys[orig]][1])
+
+        # Return
+        if is_route:
+            return dists, routes
+        else:
+            return dists
+
+    def nearest(self, origs, dests, max_dist=None):
+        """Find the nearest destination of multiple origins with respect to the
+        walking distance. A single search is run from all destinations at once
+        on the reversed sparse distance matrix of the graph.
+
+        Parameters
+        ----------
+        origs : list
+            List of nodes of origin
+        dests : list
+            List of nodes of destination
+        max_dist : float, optional
+            Maximal distance in m, leave empty for no limit
+
+        Returns
+        -------
+        nearest : list
+            List of nearest destination nodes, None if no destination is within
+            reach
+        dists : numpy.ndarray
+            Route lengths in m, infinite if no destination is within reach
+        """
+        # Run search from destinations
+        keys = self._get_matrix()
+        orig_ids = [keys[orig] for orig in origs]
+        if not dests:
+            return [None for orig in origs], np.full(len(origs), np.inf)
+        dist, pred, source = dijkstra(self._matrix.T.tocsr(), indices=[keys[dest] for dest in dests], min_only=True, return_predecessors=True,
+                                      limit=max_dist if max_dist is not None else np.inf)
+
+        # Collect origins
+        dists = dist[orig_ids]
+        nearest = [self._nodes[source[i]] if np.isfinite(dist[i]) else None for i in orig_ids]
+
+        return nearest, dists
+
+    def ring(self, node, max_dist, min_dist=0):
+        """Find nodes with a distance larger than the minimal and up to the
+        maximal distance of given node, using a single search bounded by the
+        maximal distance.
+
+        Parameters
+        ----------
+        node : integer
+            Node index
+        max_dist : float
+            Maximal distance in m
+        min_dist : float, optional
+            Minimal distance in m, nodes at exactly this distance are excluded
+
+        Returns
+        -------
+        nodes : list
+            List of nodes within the ring in order of distance
+        """
+        # Run bounded search
+        dists = self._sssp(node, max_dist)
+
+        return [x for x, dist in dists.items() if dist > min_dist and dist <= max_dist]
+
+    def rings(self, nodes, max_dist, min_dist=0, chunk=16):
+        """Find ring nodes for multiple nodes, see :func:`ring`. The searches
+        are run in chunks of nodes on a sparse distance matrix of the graph,
+        which is created once, with each chunk bounded by its largest maximal
+        distance. Since the search returns a dense distance array for each
+        node of a chunk, a chunk needs eight bytes per node of the graph for
+        each of its nodes, which is released before the next chunk.
+
+        Parameters
+        ----------
+        nodes : list
+            List of node indices
+        max_dist : float, list
+            Maximal distance in m, either for all nodes or a list for each node
+        min_dist : float, list, optional
+            Minimal distance in m, either for all nodes or a list for each node
+        chunk : integer, optional
+            Number of nodes searched at once, bounding the memory of the
+            searches
+
+        Returns
+        -------
+        rings : dictionary
+            Dictionary of nodes with a list of nodes within their ring in order
+            of distance
+        """
+        # Initialize
+        keys = self._get_matrix()
+        max_dist = np.broadcast_to(np.asarray(max_dist, dtype=float), len(nodes))
+        min_dist = np.broadcast_to(np.asarray(min_dist, dtype=float), len(nodes))
+
+        # Run searches
+        rings = {}
+        for start in range(0, len(nodes), chunk):
+            end = min(start+chunk, len(nodes))
+            dists = dijkstra(self._matrix, indices=[keys[x] for x in nodes[start:end]], limit=max_dist[start:end].max(initial=0))
+            for i in range(end-start):
+                ids = np.flatnonzero((dists[i] > min_dist[start+i]) & (dists[i] <= max_dist[start+i]))
+                rings[nodes[start+i]] = [self._nodes[x] for x in ids[np.argsort(dists[i, ids], kind="stable")]]
+            del dists
+
+        return rings
+
+    def partition(self, num_x, num_y):
+        """Partition graph nodes into a grid of spatial shards based on the
+        coordinates of the projected graph.
+
+        Parameters
+        ----------
+        num_x : integer
+            Number of cells in x-direction
+        num_y : integer
+            Number of cells in y-direction
+
+        Returns
+        -------
+        shards : list
+            List of dictionaries for non-empty cells containing the cell index
+            **cell** and the cell nodes **nodes**
+        """
+        # Get coordinates
+        pos = np.array([(self._Gp.nodes[node]["x"], self._Gp.nodes[node]["y"]) for node in self._nodes]).reshape(-1, 2)
+        low, high = pos.min(axis=0), pos.max(axis=0)
+        size = np.maximum((high-low)/[num_x, num_y], 1e-9)
+
+        # Assign nodes to cells
+        cell = np.minimum(((pos-low)/size).astype(int), [num_x-1, num_y-1])
+
+        # Create shards
+        shards = []
+        for i in range(num_x):
+            for j in range(num_y):
+                is_cell = (cell[:, 0]==i) & (cell[:, 1]==j)
+                if not is_cell.any():
+                    continue
+                shards.append({"cell": (i, j), "nodes": [self._nodes[x] for x in np.flatnonzero(is_cell)]})
+
+        return shards
+
+    def coarsen(self, size=250, shape="grid", is_log=False):
+        """Aggregate graph nodes into spatial cells and create a topology of
+        the cells. Cells are either squares of the given side length, hexagons
+        with the given distance between neighbouring cell centres, or clusters
+        of the node coordinates with one cluster per square of the given size.
+
+        Each cell is represented by its node closest to the mean position of
+        its nodes, keeping the node ids and coordinates. Cells are connected,
+        if an edge connects their nodes, with the length of the shortest
+        walking route between the representative nodes over such an edge,
+        where routes within a cell are restricted to the cell. Nodes that
+        can not be reached within their cell are taken at the euclidean
+        distance to the representative node.
+
+        The coarse topology can be used like the original one. POIs and
+        charging stations of the original topology are aggregated to the cells,
+        see :func:`aggregate`, and results can be mapped back to the original
+        nodes, see :func:`expand`.
+
+        Parameters
+        ----------
+        size : float, optional
+            Cell size in m
+        shape : string, optional
+            Cell shape, either **grid**, **hex** or **cluster**
+        is_log : bool, optional
+            True to print osmnx console output
+
+        Returns
+        -------
+        topo : Topology
+            Topology of the cells
+        """
+        # Get coordinates
+        pos = np.array([(self._Gp.nodes[node]["x"], self._Gp.nodes[node]["y"]) for node in self._nodes]).reshape(-1, 2)
+
+        # Assign nodes to cells
+        if shape=="grid":
+            labels = np.floor((pos-pos.min(axis=0))/size).astype(int)
+        elif shape=="hex":
+            # Convert to cube coordinates of pointy hexagons and round
+            radius = size/math.sqrt(3)
+            q = (math.sqrt(3)/3*pos[:, 0]-pos[:, 1]/3)/radius
+            r = 2/3*pos[:, 1]/radius
+            round_q, round_r, round_s = np.round(q), np.round(r), np.round(-q-r)
+            diff_q, diff_r, diff_s = np.abs(round_q-q), np.abs(round_r-r), np.abs(round_s+q+r)
+            is_q = (diff_q > diff_r) & (diff_q > diff_s)
+            is_r = ~is_q & (diff_r > diff_s)
+            round_q = np.where(is_q, -round_r-round_s, round_q)
+            round_r = np.where(is_r, -round_q-round_s, round_r)
+            labels = np.stack([round_q, round_r], axis=1).astype(int)
+        elif shape=="cluster":
+            num = max(1, math.ceil(np.prod(np.maximum(pos.max(axis=0)-pos.min(axis=0), size))/size**2))
+            labels = kmeans2(pos, min(num, len(self._nodes)), minit="++", seed=42)[1].reshape(-1, 1)
+        else:
+            print("Topology.coarsen: Invalid shape...")
+            return
+        cell = np.unique(labels, axis=0, return_inverse=True)[1].reshape(-1)
+        num_cells = cell.max()+1
+
+        # Get representative nodes closest to the cell mean positions
+        num_nodes = np.bincount(cell, minlength=num_cells)
+        mean = np.stack([np.bincount(cell, weights=pos[:, i], minlength=num_cells) for i in range(2)], axis=1)/num_nodes[:, np.newaxis]
+        offset = ((pos-mean[cell])**2).sum(axis=1)
+        order = np.lexsort((offset, cell))
+        reps = order[np.searchsorted(cell[order], np.arange(num_cells))]
+
+        # Calculate distances between nodes and their representatives within cells
+        self._get_matrix()
+        matrix = self._matrix.tocoo()
+        is_inner = cell[matrix.row]==cell[matrix.col]
+        inner = csr_matrix((matrix.data[is_inner], (matrix.row[is_inner], matrix.col[is_inner])), shape=matrix.shape)
+        euclid = np.sqrt(((pos-pos[reps[cell]])**2).sum(axis=1))
+        dist_out = dijkstra(inner, indices=reps, min_only=True)
+        dist_in = dijkstra(inner.T, indices=reps, min_only=True)
+        dist_out = np.where(np.isfinite(dist_out), dist_out, euclid)
+        dist_in = np.where(np.isfinite(dist_in), dist_in, euclid)
+
+        # Get shortest connections between cells
+        is_outer = ~is_inner
+        rows, cols = cell[matrix.row[is_outer]], cell[matrix.col[is_outer]]
+        lengths = dist_out[matrix.row[is_outer]]+matrix.data[is_outer]+dist_in[matrix.col[is_outer]]
+        order = np.lexsort((lengths, cols, rows))
+        rows, cols, lengths = rows[order], cols[order], lengths[order]
+        is_first = np.ones(rows.size, dtype=bool)
+        is_first[1:] = (rows[1:]!=rows[:-1]) | (cols[1:]!=cols[:-1])
+
+        # Create graphs
+        G, Gp = nx.MultiDiGraph(**self._G.graph), nx.MultiDiGraph(**self._Gp.graph)
+        for rep in reps:
+            G.add_node(self._nodes[rep], **self._G.nodes[self._nodes[rep]])
+            Gp.add_node(self._nodes[rep], **self._Gp.nodes[self._nodes[rep]])
+        for u, v, length in zip(rows[is_first], cols[is_first], lengths[is_first]):
+            G.add_edge(self._nodes[reps[u]], self._nodes[reps[v]], length=length)
+            Gp.add_edge(self._nodes[reps[u]], self._nodes[reps[v]], length=length)
+
+        # Create topology
+        topo = Topology({"name": self._loc["name"], "G": G, "Gp": Gp}, is_log=is_log)
+        topo._cells = {node: self._nodes[reps[cell[i]]] for i, node in enumerate(self._nodes)}
+
+        return topo
+
+    def aggregate(self, data):
+        """Aggregate values of original nodes to the cells of a coarse
+        topology, see :func:`coarsen`, by summing up the values of each cell.
+        For example, charging station capacities are combined to one station
+        for each cell.
+
+        Parameters
+        ----------
+        data : dictionary
+            Dictionary of original nodes and values
+
+        Returns
+        -------
+        data : dictionary
+            Dictionary of cell nodes and summed values
+        """
+        if self._cells is None:
+            return data
+        cells = {}
+        for node, val in data.items():
+            cells[self._cells[node]] = cells.get(self._cells[node], 0)+val
+        return cells
+
+    def expand(self, data):
+        """Map values of the cells of a coarse topology, see :func:`coarsen`,
+        back to the original nodes, with each node taking the value of its
+        cell. For example, extracted trajectory data can be expanded for
+        plotting on the original graph.
+
+        Parameters
+        ----------
+        data : dictionary
+            Dictionary of cell nodes and values
+
+        Returns
+        -------
+        data : dictionary
+            Dictionary of original nodes and values of their cells
+        """
+        if self._cells is None:
+            return data
+        return {node: data[cell] for node, cell in self._cells.items() if cell in data}
+
     def plot(self, pois=[], routes=[], ax=None, kwargs={"G": {}, "P": {}, "R": {}}):
         """Plot graph optionally with chargin stations and routes.
 
@@ -259,6 +777,49 @@ class Topology:
         """
         return self._Gp
 
+    def get_cache_stats(self):
+        """Get statistics of the search cache.
+
+        Returns
+        -------
+        stats : dictionary
+            Dictionary containing the number of **hits**, **misses**, cached
+            searches **entries** and their estimated size **bytes**, None if
+            the cache is disabled
+        """
+        if self._cache is None:
+            return
+        return {"hits": self._cache["hits"], "misses": self._cache["misses"], "entries": len(self._cache["data"]), "bytes": self._cache["bytes"]}
+
+    def get_fingerprint(self):
+        """Get fingerprint of the graph, which is a hash of the nodes and the
+        edges with their lengths, determined once.
+
+        Returns
+        -------
+        val : string
+            Hexadecimal sha256 hash
+        """
+        if self._fingerprint is None:
+            sha = hashlib.sha256()
+            sha.update(np.array(self._nodes, dtype=np.int64).tobytes())
+            sha.update(np.array([(u, v) for u, v in self._G.edges()], dtype=np.int64).tobytes())
+            sha.update(np.array([length for u, v, length in self._G.edges(data="length", default=1)], dtype=float).tobytes())
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
+
+    def get_cells(self):
+        """Get cells of the original nodes of a coarse topology, see
+        :func:`coarsen`.
+
+        Returns
+        -------
+        val : dictionary
+            Dictionary of original nodes and their cell nodes, None if the
+            topology is not coarsened
+        """
+        return self._cells
+
     def get_nodes(self):
         """Get list of nodes of graph.
 
@@ -268,3 +829,22 @@ class Topology:
             List of node ids of graph
         """
         return self._nodes
+
+
+def _dists_task(topo, task):
+    """Helper function for calculating distances from a chunk of origins in a
+    worker process.
+
+    Parameters
+    ----------
+    topo : Topology
+        Topology object
+    task : dictionary
+        Search parameters
+
+    Returns
+    -------
+    results : list
+        List of distance arrays and route lists for each origin
+    """
+    return topo._dists(task["orig_ids"], task["dest_ids"], task["is_route"])
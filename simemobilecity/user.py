@@ -21,6 +21,8 @@ class User(P):
     ident : string, optional
         Optional user name
     """
+    __slots__ = ("_ident",)
+
     def __init__(self, p, ident=""):
         # Call super class
         super(User, self).__init__(p)
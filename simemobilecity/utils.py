@@ -6,12 +6,23 @@
 
 
 import os
+import json
 import time
 import pickle
 import fileinput
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
 
 from shutil import copyfile
 
+from simemobilecity.partition import T
+
+
+# Object shared with worker processes
+_shared = None
+
 
 def mkdirp(directory):
     """Create directory if it does not exist.
@@ -119,6 +130,75 @@ def replace(file_link, old, new):
         print(line.rstrip().replace(old, new))
 
 
+def _init_shared(obj):
+    """Initialize worker process with the shared object.
+
+    Parameters
+    ----------
+    obj : Object
+        Shared object
+    """
+    global _shared
+    _shared = obj
+
+
+def _call_shared(args):
+    """Call a function with the shared object of the worker process.
+
+    Parameters
+    ----------
+    args : tuple
+        Function and task
+
+    Returns
+    -------
+    result : Object
+        Function result
+    """
+    func, task = args
+    return func(_shared, task)
+
+
+def parallel(func, obj, tasks, processes):
+    """Apply a function to a list of tasks in a process pool. The function is
+    called with a shared object and a task, and has to be defined on module
+    level. Where available, worker processes are forked, so that the shared
+    object is inherited instead of pickled. Otherwise it is pickled once for
+    each worker process and not for each task.
+
+    Parameters
+    ----------
+    func : function
+        Function with parameters object and task
+    obj : Object
+        Shared object
+    tasks : list
+        List of tasks
+    processes : integer
+        Number of processes
+
+    Returns
+    -------
+    results : list
+        List of function results in order of the tasks
+    """
+    global _shared
+
+    # Fork processes if possible
+    if "fork" in mp.get_all_start_methods():
+        _shared = obj
+        ctx, init_args = mp.get_context("fork"), {}
+    else:
+        ctx, init_args = mp.get_context(), {"initializer": _init_shared, "initargs": (obj,)}
+
+    # Run pool
+    try:
+        with ctx.Pool(processes, **init_args) as pool:
+            return pool.map(_call_shared, [(func, task) for task in tasks])
+    finally:
+        _shared = None
+
+
 def save(obj, link):
     """Save an object using pickle in the specified link.
 
@@ -148,3 +228,165 @@ def load(link):
     """
     with open(link, 'rb') as f:
         return pickle.load(f)
+
+
+def save_table(traj, link, fmt="parquet", is_day=False):
+    """Export a trajectory dictionary of the MC code into columnar files,
+    that can be read by pandas or pyarrow without this package. The given
+    link is a directory containing
+
+    * **meta.json** - Simulation input and trajectory dimensions and data types
+    * **nodes**, **cs**, **dist** - One file for each trajectory, or a folder with one file for each day
+
+    Each trajectory file contains one row for each non-empty day, hour,
+    node, and user type entry with columns **day**, **hour**, **node**,
+    **user**, **success** and **fail_** *failure*. The available formats are
+
+    * **parquet** - Apache Parquet files, requires pyarrow or fastparquet, partitioned folders can be read as a dataset
+    * **npz** - Numpy zip archives with one array for each column
+
+    Parameters
+    ----------
+    traj : dictionary
+        Simulation trajectory of the MC code
+    link : string
+        Directory link for output files
+    fmt : string, optional
+        File format
+    is_day : bool, optional
+        True to partition trajectories by day
+    """
+    # Process format
+    if fmt not in ["parquet", "npz"]:
+        print("Utils.save_table: Invalid format, choose from \"parquet\", \"npz\"...")
+        return
+
+    # Initialize
+    mkdirp(link)
+    meta = {"format": fmt, "is_day": is_day, "tables": {}}
+    if "inp" in traj.keys():
+        meta["weeks"] = traj["inp"]["weeks"]
+        meta["cs"] = [[int(node), int(cap)] for node, cap in traj["inp"]["cs"].items()]
+
+    # Run through trajectories
+    for name, t in traj.items():
+        if isinstance(t, T):
+            # Add dimensions
+            node_keys = t.get_node_keys()
+            meta["tables"][name] = {"num_nodes": t.get_num_nodes(), "num_users": t.get_num_users(),
+                                    "num_days": t.get_num_days(), "num_hours": t.get_num_hours(),
+                                    "failures": t.get_failures(), "dtype": t.get_array().dtype.name,
+                                    "nodes": [int(node) for node in node_keys.keys()] if node_keys else []}
+
+            # Write files
+            for days in [[day] for day in range(t.get_num_days())] if is_day else [[]]:
+                frame = t.get_frame(days=days)
+                if is_day:
+                    file_link = os.path.join(link, name, "day="+str(days[0]))
+                    mkdirp(file_link)
+                    file_link = os.path.join(file_link, "data."+fmt) if fmt=="parquet" else file_link+"."+fmt
+                    frame = frame.drop(columns="day") if fmt=="parquet" else frame
+                else:
+                    file_link = os.path.join(link, name+"."+fmt)
+                if fmt=="parquet":
+                    frame.to_parquet(file_link, index=False)
+                else:
+                    np.savez(file_link, **{col: frame[col].to_numpy() for col in frame.columns})
+
+    # Write meta data
+    with open(os.path.join(link, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_table(link, name, columns=[], days=[], nodes=[]):
+    """Load a trajectory table exported by :func:`save_table` as a data frame.
+    Only the requested columns are read. Parquet files filter rows while
+    reading, and partitioned trajectories only open the files of the requested
+    days.
+
+    Parameters
+    ----------
+    link : string
+        Directory link of exported files
+    name : string
+        Trajectory name
+    columns : list, optional
+        List of columns to load, leave empty for all columns
+    days : list, optional
+        List of day ids to load, leave empty for all days
+    nodes : list, optional
+        List of node ids to load, leave empty for all nodes
+
+    Returns
+    -------
+    frame : pandas.DataFrame
+        Trajectory data frame
+    """
+    # Load meta data
+    with open(os.path.join(link, "meta.json"), "r") as f:
+        meta = json.load(f)
+    fmt = meta["format"]
+    num_days = meta["tables"][name]["num_days"]
+
+    # Process columns - filter columns are loaded and removed afterwards
+    cols = list(columns)
+    cols += [col for col, val in [("day", days), ("node", nodes)] if val and columns and col not in columns]
+
+    # Parquet
+    if fmt=="parquet":
+        filters = [(col, "in", list(val)) for col, val in [("day", days), ("node", nodes)] if val]
+        file_link = os.path.join(link, name) if meta["is_day"] else os.path.join(link, name+".parquet")
+        frame = pd.read_parquet(file_link, columns=cols if cols else None, filters=filters if filters else None)
+        if "day" in frame.columns:
+            frame["day"] = frame["day"].astype(int)
+    # Numpy
+    else:
+        frames = []
+        for day_files in [[day] for day in (days if days else range(num_days))] if meta["is_day"] else [[]]:
+            file_link = os.path.join(link, name, "day="+str(day_files[0])+".npz") if day_files else os.path.join(link, name+".npz")
+            with np.load(file_link) as data:
+                frames.append(pd.DataFrame({col: data[col] for col in (cols if cols else data.files)}))
+        frame = pd.concat(frames, ignore_index=True)
+        if days:
+            frame = frame[frame["day"].isin(days)]
+        if nodes:
+            frame = frame[frame["node"].isin(nodes)]
+
+    # Remove filter columns
+    frame = frame[columns] if columns else frame
+
+    return frame.reset_index(drop=True)
+
+
+def load_traj(link):
+    """Load a complete trajectory dictionary exported by :func:`save_table`.
+    Trajectories are created with their exported data type, exports without
+    data type are loaded as float.
+
+    Parameters
+    ----------
+    link : string
+        Directory link of exported files
+
+    Returns
+    -------
+    traj : dictionary
+        Trajectory dictionary containing trajectory objects and inputs
+    """
+    # Load meta data
+    with open(os.path.join(link, "meta.json"), "r") as f:
+        meta = json.load(f)
+
+    # Create trajectories
+    traj = {}
+    for name, table in meta["tables"].items():
+        node_keys = {node: i for i, node in enumerate(table["nodes"])}
+        dtype = np.dtype(table.get("dtype", "float64"))
+        traj[name] = T(table["num_nodes"], table["num_users"], num_days=table["num_days"], num_hours=table["num_hours"], failures=table["failures"], node_keys=node_keys, dtype=dtype)
+        traj[name].set_frame(load_table(link, name))
+
+    # Process input
+    if "weeks" in meta.keys():
+        traj["inp"] = {"weeks": meta["weeks"], "cs": {node: cap for node, cap in meta["cs"]}}
+
+    return traj
@@ -60,11 +60,63 @@ class UserModelCase(unittest.TestCase):
         sec.utils.save([1, 1, 1], file_link)
         self.assertEqual(sec.utils.load(file_link), [1, 1, 1])
 
+        t = sec.T(2, 1, node_keys={5: 0, 7: 1})
+        t.add_success(0, 8, 7, 0)
+        t.add_fail(3, 9, 5, 0, "occ")
+        sec.utils.save_table({"nodes": t, "inp": {"weeks": 1, "cs": {7: 2}}}, "output/table", fmt="npz", is_day=True)
+        self.assertEqual(sec.utils.load_table("output/table", "nodes", columns=["node"], days=[3])["node"].tolist(), [5])
+        traj = sec.utils.load_traj("output/table")
+        self.assertEqual(traj["nodes"].get_fail(3, 9, 5, 0, "occ"), 1)
+        self.assertEqual(traj["nodes"].get_success(0, 8, 7, 0), 1)
+        self.assertEqual(traj["inp"]["cs"], {7: 2})
+        t = sec.T(2, 1, node_keys={5: 0, 7: 1}, dtype=int)
+        t.add_success(0, 8, 7, 0)
+        sec.utils.save_table({"nodes": t}, "output/table_int")
+        traj = sec.utils.load_traj("output/table_int")
+        self.assertEqual(traj["nodes"].get_array().dtype, t.get_array().dtype)
+        self.assertEqual(traj["nodes"].get_success(0, 8, 7, 0), 1)
+
+        # Queueing
+        self.assertEqual(round(sec.queueing.erlang_b(2, 1)[()], 2), 0.2)
+        self.assertEqual(round(sec.queueing.erlang_b_load(2, 0.2)[()], 2), 1)
+        self.assertEqual(sec.queueing.erlang_b_capacity([1, 4], 0.1).tolist(), [3, 7])
+
         print()
         sec.utils.toc(sec.utils.tic(), message="Test", is_print=True)
         self.assertEqual(round(sec.utils.toc(sec.utils.tic(), is_print=True)), 0)
 
 
+    #########
+    # Cache #
+    #########
+    def test_cache(self):
+        # Initialize
+        cache = sec.Cache("output/cache", max_entries=2)
+        cache.clear()
+        key = cache.key("test", {1: 2}, sec.P(0.5), [0, 1, 2])
+        self.assertEqual(key, cache.key("test", {1: 2}, sec.P(0.5), [0, 1, 2]))
+        self.assertNotEqual(key, cache.key("test", {1: 3}, sec.P(0.5), [0, 1, 2]))
+        self.assertEqual(cache.key(sec.User(0.5)), cache.key(sec.User(0.5)))
+        self.assertNotEqual(cache.key(sec.User(0.5)), cache.key(sec.P(0.5)))
+
+        # Save and load
+        self.assertIsNone(cache.load(key))
+        cache.save(key, {"test": [1, 2]})
+        self.assertEqual(cache.load(key), {"test": [1, 2]})
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 1})
+
+        # Corruption
+        with open(os.path.join(cache.get_link(), key+".obj"), "ab") as file_out:
+            file_out.write(b"DOTA")
+        self.assertIsNone(cache.load(key))
+        self.assertFalse(os.path.exists(os.path.join(cache.get_link(), key+".obj")))
+
+        # Eviction
+        for i in range(3):
+            cache.save(cache.key(i), i)
+        self.assertEqual(len(os.listdir(cache.get_link())), 2)
+
+
     ###############
     # Probability #
     ###############
@@ -77,12 +129,34 @@ class UserModelCase(unittest.TestCase):
 
         # Probability
         p.set_p({day: {hour: 1/7 for hour in range(24)} for day in range(7)})
-        p.set_p_day(0, {0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1})
-        self.assertEqual(p.get_p_day(0), {0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1})
+        p.set_p_day(0, {hour: 1 for hour in range(24)})
+        self.assertEqual(p.get_p_day(0), {hour: 1 for hour in range(24)})
         p.set_p_hour(0, 0, 0.5)
         self.assertEqual(p.get_p_hour(0, 0), 0.5)
         self.assertEqual(p.get_p()[0][0], 0.5)
 
+        # Arithmetic
+        p_sum = sum([p, sec.P(0.5)])*2
+        self.assertEqual(p_sum.get_p_hour(0, 0), 2)
+        self.assertEqual(p_sum.get_p_hour(1, 0), 2/7+1)
+        p_sum.normalize("week")
+        self.assertEqual(p_sum.get_p_hour(0, 1), 1)
+        p_sum.normalize("hour")
+        self.assertEqual(p_sum.get_p_hour(3, 5), 1)
+        stack = sec.partition.stack([p, sec.P({day: day for day in range(7)})])
+        self.assertEqual(stack.shape, (2, 7, 24))
+        self.assertEqual(sec.partition.normalize(stack, "day")[1, 6, 0], 1)
+        self.assertEqual(sec.partition.normalize(stack, "day")[0, 6, 0], 1/42)
+        self.assertEqual(sec.partition.normalize(stack, "hour")[1, 0, 0], 0)
+        with self.assertRaises(AttributeError):
+            p.attribute = 0
+
+        # Objects pickled with attribute dictionaries
+        user = sec.User.__new__(sec.User)
+        user.__setstate__({"_p": {day: {hour: 0.5 for hour in range(24)} for day in range(7)}, "_ident": "old"})
+        self.assertEqual(user.get_p_hour(3, 5), 0.5)
+        self.assertEqual(user.get_ident(), "old")
+
         # Check errors
         print()
         self.assertIsNone(sec.P({}).get_p())
@@ -121,6 +195,49 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(extract[1]["success"], 0.5)
         self.assertEqual(extract[1]["fail"]["dist"], 0.5)
 
+        # Query
+        self.assertEqual(t.query([0, 7], [20, 24], 1, 1).tolist(), [10, 0, 10])
+        t.add_fail(5, 21, 1, 1, "occ")
+        self.assertEqual(t.query([5, 7], [21, 24], 1, 1).tolist(), [10, 1, 10])
+        self.assertEqual(t.query_batch([[0, 6], [6, 7]], [[0, 24], [23, 24]], [1, 1], [1, 0]).tolist(), [[0, 1, 0], [0, 0, 0]])
+
+        # Statistics
+        t = sec.T(2, 1, failures=["dist"])
+        t.set_stats(bins=[100, 200])
+        for dist in [50, 150, 250]:
+            t.add_success(0, 8, 1, 0)
+            t.add_fail_dist(0, 8, 1, 0, dist)
+            t.fold()
+        t.fold()
+        self.assertEqual(t.get_num_samples(), 4)
+        self.assertEqual(t.get_mean(0, 8, 1, 0), 0.75)
+        self.assertEqual(t.get_var(0, 8, 1, 0), 0.25)
+        self.assertEqual(t.get_hist(1, 0, "dist").tolist(), [1, 1, 1])
+        extract = t.extract([0], [8], [0], is_norm=False, is_ci=True)
+        self.assertEqual(round(extract[1]["ci"]["success"], 2), 1.96)
+
+        # Memory-mapped
+        t = sec.T(2, 2, 7, 24, node_keys={5: 0, 7: 1}, link="output/traj_mmap.npy")
+        t.add_success(0, 8, 7, 1)
+        t.add_fail(0, 9, 7, 0, "occ")
+        sec.utils.save(t, "output/traj_mmap.obj")
+        t = sec.utils.load("output/traj_mmap.obj")
+        self.assertEqual(t.get_link(), os.path.abspath("output/traj_mmap.npy"))
+        self.assertEqual(sec.T(2, 2, dtype=int).get_array().dtype.kind, "i")
+        t_stats = sec.T(2, 2, link="output/traj_stats.npy")
+        t_stats.set_stats()
+        t_stats.add_success(0, 0, 1, 1)
+        t_stats.fold()
+        sec.utils.save(t_stats, "output/traj_stats.obj")
+        t_stats = sec.utils.load("output/traj_stats.obj")
+        self.assertEqual(t_stats.get_mean(0, 0, 1, 1), 1)
+        self.assertTrue(os.path.exists("output/traj_stats_mean.npy"))
+        self.assertEqual(t.get_success(0, 8, 7, 1), 1)
+        self.assertEqual(t.extract([0], [8, 9], [0, 1])[7]["fail"]["occ"], 0.5)
+        self.assertEqual(t.extract([0], [8], [0], is_norm=False)[7]["success"], 0)
+        with self.assertRaises(ValueError):
+            t.add_success(0, 8, 7, 1)
+
 
     ########
     # User #
@@ -184,6 +301,42 @@ class UserModelCase(unittest.TestCase):
         self.assertEqual(round(route_len, 2), 333.71)
         route_len, route = topo.dist(1955541, dest, True)
 
+        # Rings
+        ring = topo.ring(1955541, 300, 150)
+        self.assertEqual(set(ring), set(topo.radius(1955541, 300))-set(topo.radius(1955541, 150)))
+        self.assertEqual(set(topo.rings([1955541, dest], 300, 150)[1955541]), set(ring))
+
+        # Batched distances
+        dists, routes = topo.dists([1955541], [dest, 1955541], is_route=True)
+        self.assertEqual(round(dists[0, 0], 2), round(route_len, 2))
+        self.assertEqual(routes[0][1], [1955541])
+        self.assertEqual(topo.dists([1955541, dest], [dest, dest], is_pair=True, processes=2)[1], 0)
+
+        # Nearest destinations
+        nearest, dists = topo.nearest([1955541, dest], [dest])
+        self.assertEqual(nearest, [dest, dest])
+        self.assertEqual(round(dists[0], 2), round(route_len, 2))
+
+        # Search cache
+        topo.set_cache(max_entries=2)
+        self.assertEqual(round(topo.dist(1955541, dest), 2), round(route_len, 2))
+        self.assertEqual(set(topo.radius(1955541, 300)), set(ring)|set(topo.radius(1955541, 150)))
+        self.assertEqual(topo.get_cache_stats()["hits"], 2)
+        topo.set_cache(is_cache=False)
+        self.assertIsNone(topo.get_cache_stats())
+
+        # Spatial partition
+        shards = topo.partition(2, 2)
+        self.assertEqual(sum(len(shard["nodes"]) for shard in shards), len(topo.get_nodes()))
+
+        # Coarsening
+        coarse = topo.coarsen(300, "hex")
+        self.assertLess(len(coarse.get_nodes()), len(topo.get_nodes()))
+        self.assertEqual(set(coarse.get_cells().values()), set(coarse.get_nodes()))
+        self.assertEqual(sum(coarse.aggregate({1955541: 2, dest: 3}).values()), 5)
+        self.assertEqual(len(coarse.expand({node: 1 for node in coarse.get_nodes()})), len(topo.get_nodes()))
+        self.assertIsNone(topo.coarsen(300, "DOTA"))
+
         # Plot
         topo.plot(pois=[P])
         plt.savefig("output/topo_cafe.pdf", format="pdf", dpi=1000)
@@ -217,6 +370,63 @@ class UserModelCase(unittest.TestCase):
         # self.assertEqual(poi.get_nodes()[0], 3571318797)
 
 
+    ##############
+    # Assignment #
+    ##############
+    def test_assignment(self):
+        # self.skipTest("Temporary")
+
+        # Initialize
+        name = "Munich, Bavaria, Germany"
+        G = sec.utils.load("data/munich_G.obj")
+        Gp = sec.utils.load("data/munich_Gp.obj")
+        topo = sec.Topology({"name": name, "G": G, "Gp": Gp}, is_log=False)
+        assign = sec.Assignment(topo, [1249710076, 183888004])
+
+        # Insert and remove
+        assign.add(1955541)
+        self.assertEqual(assign.get_station(1955541), 1955541)
+        self.assertEqual(assign.get_dist(1955541), 0)
+        assign.remove(1955541)
+        self.assertEqual(round(assign.get_dist(1955541), 2), round(topo.dist(1955541, assign.get_station(1955541)), 2))
+        assign.update({1249710076: 4})
+        self.assertEqual(assign.get_stations(), [1249710076])
+
+        # Nearest stations
+        assign = sec.Assignment(topo, [1249710076, 183888004], k=2)
+        self.assertLessEqual(assign.get_dist(1955541, 0), assign.get_dist(1955541, 1))
+        self.assertEqual(assign.get_k(), 2)
+        assign.add(1955541)
+        assign.remove(1955541)
+        table = [assign.get_table(rank)[1] for rank in range(2)]
+        fresh = sec.Assignment(topo, [1249710076, 183888004], k=2)
+        for rank in range(2):
+            self.assertEqual([round(dist, 2) for dist in table[rank]], [round(dist, 2) for dist in fresh.get_table(rank)[1]])
+
+
+    ###########
+    # Spacing #
+    ###########
+    def test_spacing(self):
+        # self.skipTest("Temporary")
+
+        # Initialize
+        name = "Munich, Bavaria, Germany"
+        G = sec.utils.load("data/munich_G.obj")
+        Gp = sec.utils.load("data/munich_Gp.obj")
+        topo = sec.Topology({"name": name, "G": G, "Gp": Gp}, is_log=False)
+        spacing = sec.Spacing(topo, [1249710076], min_dist=150, buffer_size=2)
+
+        # Check and add
+        self.assertFalse(spacing.is_free(1249710076))
+        self.assertTrue(spacing.is_free(1955541))
+        spacing.add(1955541)
+        self.assertFalse(spacing.is_free(1955541))
+        self.assertEqual(spacing.filter([1249710076, 1955541]), [])
+        self.assertEqual(spacing.get_stations(), [1249710076, 1955541])
+        self.assertEqual(spacing.get_min_dist(), 150)
+
+
     ######
     # MC #
     ######
@@ -260,11 +470,107 @@ class UserModelCase(unittest.TestCase):
         mc.run("", 0, 0, p_norm="day")
         mc.run("output/mc_test.obj", 1, 1, trials=1, p_norm="hour", capacity=capacity)
 
+        # Run layouts
+        trajs = mc.run_batch("output/mc_batch.obj", [capacity, {1249710076: 8, 183888004: 2}], 1, 0, trials=1, p_norm="hour", seed=42, processes=2)
+        self.assertEqual(len(trajs), 2)
+        self.assertEqual(trajs[1]["inp"]["cs"][1249710076], 8)
+
+        # Run with station fallback
+        mc.set_assignment(sec.Assignment(topo, k=2))
+        mc.run("", 1, 0, trials=1, capacity=capacity, seed=42)
+        far = (mc._assign_dist[:, 0] > mc._nodes_dist).nonzero()[0][0]
+        mc._station_tot[:] = mc._station_max
+        self.assertEqual(mc._choose_station(far), (mc._assign[far, 0], mc._assign_dist[far, 0], "dist"))
+        mc.set_assignment(None)
+
+        # Run compiled kernel
+        mc.run("", 1, 1, trials=1, capacity=capacity, seed=42, is_jit=True)
+
+        # Run event engine
+        traj = mc.run("", 1, 1, trials=1, capacity=capacity, seed=42, engine="event", slots=4)
+        self.assertEqual(sum(mc.get_occupancy()[1249710076]), mc._station_tot[0])
+
+        # Warm start from occupancy
+        mc.run("", 0, 0, capacity=capacity, occupancy={1249710076: [10]})
+        self.assertEqual(mc.get_occupancy()[1249710076], [4])
+
+        # Changed POIs are processed again
+        nodes_dist = mc._nodes_dist.copy()
+        mc._pois[0].set_max_dist(100)
+        mc.run("", 0, 0, capacity=capacity)
+        self.assertFalse((mc._nodes_dist==nodes_dist).all())
+        mc._pois[0].set_max_dist(500)
+
+        # Optimization loop
+        results = sec.Optimize(topo).loop("", mc, capacity, 1, 1, rounds=1, kwargs={"mc": {"trials": 1, "seed": 42}, "opt": {"mode": "greedy"}})
+        self.assertLessEqual(len(results["summary"]), 2)
+        self.assertAlmostEqual(sum(results["summary"][0][key] for key in ["success", "occ", "dist"]), 1)
+        results = sec.Optimize(topo).loop("", mc, capacity, 1, 1, rounds=2, budget=1, kwargs={"mc": {"trials": 1, "seed": 42}, "opt": {"crit": {"occ": 0.1}}})
+        self.assertLessEqual(len(results["cs"]), len(capacity)+1)
+        self.assertIsNone(sec.Optimize(topo).loop("", mc, capacity, 1, 1, budget=1, kwargs={"opt": {"mode": "random"}}))
+        self.assertIsNone(sec.Optimize(topo).loop("", mc, capacity, 1, 1, kwargs={"mc": {"engine": "DOTA"}}))
+        self.assertIsNone(mc.get_assignment())
+
+        # Evaluate alternative layouts
+        layouts = sec.Optimize(topo).evaluate("", mc, traj, num=2, weeks=1, weeks_equi=0, seed=42, processes=2, kwargs={"mc": {"trials": 1}})
+        self.assertLessEqual(layouts[0]["fail"], layouts[-1]["fail"])
+
+        # Sharded runs
+        traj = mc.run_shards("", 1, 1, capacity=capacity, trials=1, p_norm="hour", num_x=2, num_y=2, seed=42, processes=2)
+        self.assertEqual(traj["nodes"].get_array()[:, :, :, 0].sum(), traj["cs"].get_array()[:, :, :, 0].sum())
+        attempts = [mc.run("", 2, 0, capacity=capacity, p_norm="hour", seed=seed)["nodes"].get_array().sum() for seed in range(3)]
+        attempts_shards = [mc.run_shards("", 2, 0, capacity=capacity, p_norm="hour", seed=seed, processes=2)["nodes"].get_array().sum() for seed in range(3)]
+        self.assertLess(abs(sum(attempts_shards)-sum(attempts)), 0.1*sum(attempts))
+        self.assertEqual(len(mc.get_occupancy()), len(capacity))
+        mc.set_assignment(sec.Assignment(topo, k=2))
+        mc.run_shards("", 1, 0, capacity=capacity, trials=1, seed=42)
+        self.assertEqual(len(set(mc._partition(2, 2)[1])), 1)
+        mc.set_assignment(None)
+
+        # Cached runs
+        cache = sec.Cache("output/cache_mc")
+        cache.clear()
+        mc.set_cache(cache)
+        mc.run("", 1, 0, trials=1, capacity=capacity, seed=42)
+        mc.run("", 1, 0, trials=1, capacity=capacity, seed=42)
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 1})
+        mc.run("", 1, 0, trials=1, capacity=capacity)
+        mc.run("", 1, 0, trials=1, capacity=capacity)
+        self.assertEqual(cache.get_stats(), {"hits": 1, "misses": 3})
+        dist = mc.run("", 1, 0, trials=1, capacity=capacity, seed=42)["dist"].get_array().sum()
+        mc._pois[0].set_max_dist(50)
+        dist_poi = mc.run("", 1, 0, trials=1, capacity=capacity, seed=42)["dist"].get_array().sum()
+        mc._pois[0].set_max_dist(500)
+        self.assertEqual(cache.get_stats(), {"hits": 2, "misses": 4})
+        self.assertNotEqual(dist_poi, dist)
+        mc.set_cache(None)
+
+        # Estimate expected values
+        traj = mc.estimate("", 1, 1, capacity=capacity, p_norm="hour")
+        self.assertEqual(traj["nodes"].get_failures(), ["occ", "dist"])
+        self.assertGreaterEqual(traj["cs"].extract(range(7), range(24), [0], is_norm=False)[1249710076]["success"], 0)
+        traj_single = mc.estimate("", 1, 0, capacity={1249710076: 1}, p_norm="hour")
+        success = traj_single["cs"].get_success(0, 0, 1249710076, 0)
+        occ = traj_single["cs"].get_fail(0, 0, 1249710076, 0, "occ")
+        self.assertAlmostEqual(occ/(success+occ), sec.queueing.erlang_b(1, success+occ)[()])
+
+        # Coarse topology keeps expected demand
+        mc_coarse = sec.MC(topo.coarsen(300, "hex"))
+        for poi in mc._pois:
+            mc_coarse.add_poi(poi)
+        mc_coarse.add_user(user_shop, 100)
+        mc_coarse.set_drivers({day: {hour: 20 for hour in range(24)} for day in range(7)})
+        traj_coarse = mc_coarse.estimate("", 1, 1, capacity=capacity, p_norm="hour")
+        self.assertAlmostEqual(traj_coarse["nodes"].get_array().sum(), traj["nodes"].get_array().sum())
+        mc_coarse.run("", 1, 0, trials=1, capacity=capacity, p_norm="hour", seed=42)
+
         # Check errors
         self.assertIsNone(mc.add_user(sec.User(1), 1337))
         self.assertIsNone(mc.add_user(sec.User(1), 13.37))
         self.assertIsNone(mc.set_drivers("DOTA"))
         self.assertIsNone(mc.set_drivers({0: 1}))
+        self.assertIsNone(mc.run("", 1, 0, capacity=capacity, engine="DOTA"))
+        self.assertIsNone(mc.run("", 1, 0, capacity=capacity, engine="event", slots=0))
         self.assertIsNone(mc.run("", 0, 0, p_norm="DOTA"))
         self.assertIsNone(mc_temp.run("", 1, 1))
         self.assertIsNone(mc_temp_2.run("", 0, 0))
@@ -320,6 +626,29 @@ class UserModelCase(unittest.TestCase):
 
         print(len(cap), sum(cap.values()))
 
+        # Greedy placement
+        cap_greedy = opt.run("", traj, mode="greedy", budget=5)
+        self.assertLessEqual(len(cap_greedy), len(traj["inp"]["cs"])+5)
+
+        # Exact placement
+        if sec.optimize.IS_MILP:
+            cap_milp = opt.run("", traj, mode="milp", budget=5)
+            self.assertLessEqual(len(cap_milp), len(traj["inp"]["cs"])+5)
+            near = [node for node in topo.radius(1249710076, 100) if node!=1249710076][0]
+            cap_twin = {}
+            opt._milp(cap_twin, {1: 5, 2: 4}, {1249710076: [1], 183888004: [1], near: [2]}, 2, 150)
+            self.assertEqual(set(cap_twin), {183888004, near})
+        else:
+            self.assertIsNone(opt.run("", traj, mode="milp", budget=5))
+
+        # Erlang capacity sizing
+        cap_erlang = opt.run("", traj, crit={"occ": 0.15}, sizing="erlang")
+        self.assertTrue(all(cap_erlang[node] >= val for node, val in traj["inp"]["cs"].items()))
+        extract = {1: {"success": 6, "fail": {"occ": 2, "dist": 2}}}
+        self.assertEqual(opt._size(extract, {1: 2}, 0.1), {1: 3})
+        self.assertIsNone(opt.run("", traj, mode="DOTA"))
+        self.assertIsNone(opt.run("", traj, sizing="DOTA"))
+
         topo.plot(pois=[topo.get_G().subgraph(cap.keys())])
         plt.savefig("output/optimize.pdf", format="pdf", dpi=1000)
 